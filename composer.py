@@ -1,13 +1,20 @@
 import argparse
+import contextlib
 import datetime
+import functools
+import hashlib
+import heapq
 import io
 import json
+import logging
 import os
 import re
 import sys
+import time
 import warnings
-from collections import defaultdict
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from pathlib import Path, PurePath
 
 import luaparser.ast as ast
 import luaparser.astnodes as astnodes
@@ -28,13 +35,13 @@ warnings.filterwarnings(
 # Fallback if messages are less predictable but we trust the module source of warning:
 # warnings.filterwarnings("ignore", category=SyntaxWarning, module="luaparser\.printers")
 
-# Disallowed patterns for regex removal/replacement (package lines)
+# Disallowed patterns for regex line removal (package lines); each matches a whole line, newline included.
 # print and log are handled by specific regex transformations now if not removed by strict checks.
 # require is handled by its own pattern for removal.
-DISALLOWED_LINE_PATTERNS = {
+DISALLOWED_LINE_PATTERNS = (
     # package line removal is handled by this pattern
-    re.compile(r"^[ \t]*[^\r\n]*\bpackage\b[^\r\n]*\r?\n?", re.MULTILINE): "",
-}
+    r"^[ \t]*[^\r\n]*\bpackage\b[^\r\n]*\r?\n?",
+)
 
 # Pattern to find 'require' statements for REMOVAL during sanitization
 REQUIRE_REMOVAL_PATTERN = re.compile(
@@ -48,212 +55,579 @@ REQUIRE_REMOVAL_PATTERN = re.compile(
 )
 
 
+# The only characters that can change _find_balanced_parentheses' state: escapes, quotes and parentheses
+_PAREN_SCANNER_PATTERN = re.compile(r"""\\[\s\S]|["'()]""")
+
+
 def _find_balanced_parentheses(text, start_pos):
     """Find the matching closing parenthesis for an opening parenthesis at start_pos."""
     if start_pos >= len(text) or text[start_pos] != "(":
         return -1
 
     paren_count = 1
-    pos = start_pos + 1
-    in_string = False
-    escape_next = False
     string_char = None
 
-    while pos < len(text) and paren_count > 0:
-        char = text[pos]
-
-        if escape_next:
-            escape_next = False
-        elif char == "\\":
-            escape_next = True
-        elif not in_string:
-            if char in ['"', "'"]:
-                in_string = True
-                string_char = char
-            elif char == "(":
-                paren_count += 1
-            elif char == ")":
-                paren_count -= 1
-        elif in_string and char == string_char:
-            in_string = False
-            string_char = None
+    # Jump between state-changing characters instead of stepping through every character
+    for match in _PAREN_SCANNER_PATTERN.finditer(text, start_pos + 1):
+        char = match.group()
+        if len(char) == 2:
+            continue  # Escaped character
+        if string_char:
+            if char == string_char:
+                string_char = None
+        elif char in "\"'":
+            string_char = char
+        elif char == "(":
+            paren_count += 1
+        else:
+            paren_count -= 1
+            if paren_count == 0:
+                return match.start()
 
-        pos += 1
+    return -1
 
-    return pos - 1 if paren_count == 0 else -1
 
+def _safe_regex_replace(pattern, replacements, text):
+    """Safely replace or remove function calls in a single pass, handling nested parentheses properly.
 
-def _safe_regex_replace(pattern, replacement, text, is_removal=False):
-    """Safely replace function calls while handling nested parentheses properly."""
+    `pattern` must match a function name directly followed by its opening parenthesis and capture the
+    name in group 1. Names found in `replacements` are renamed to the mapped value, keeping the arguments
+    (which are scanned further, so nested calls are handled too); any other matched call is removed
+    entirely, including its arguments and an optional trailing semicolon. Calls with unbalanced
+    parentheses are left untouched.
+    """
     result = []
     last_end = 0
+    pos = 0
+
+    while True:
+        match = pattern.search(text, pos)
+        if match is None:
+            break
+        paren_start = match.end()  # The pattern's lookahead guarantees "(" here
+        paren_end = _find_balanced_parentheses(text, paren_start)
+
+        if paren_end == -1:
+            # Unbalanced parentheses, keep original
+            pos = match.end()
+            continue
 
-    for match in pattern.finditer(text):
-        # Add text before this match
         result.append(text[last_end : match.start()])
-
-        # Find the opening parenthesis in the original text starting from match position
-        paren_start_in_text = text.find("(", match.start())
-        if paren_start_in_text == -1 or paren_start_in_text >= match.end() + 10:  # Safety margin
-            # No parentheses found nearby, handle as simple replacement
-            if is_removal:
-                pass  # Skip adding anything for removal
-            else:
-                result.append(match.expand(replacement))
-            last_end = match.end()
+        replacement = replacements.get(match.group(1))
+        if replacement is None:
+            # Removal: skip the whole call and any trailing semicolon
+            last_end = paren_end + 1
+            if text[last_end : last_end + 1] == ";":
+                last_end += 1
+            pos = last_end
         else:
-            # Find the balanced closing parenthesis
-            paren_end = _find_balanced_parentheses(text, paren_start_in_text)
-
-            if paren_end == -1:
-                # Unbalanced parentheses, keep original
-                result.append(text[match.start() : match.end()])
-                last_end = match.end()
-            else:
-                # Extract the full function call with balanced parentheses
-                if is_removal:
-                    # For removal, skip adding anything and also skip any trailing semicolon
-                    next_pos = paren_end + 1
-                    if next_pos < len(text) and text[next_pos : next_pos + 1] == ";":
-                        next_pos += 1
-                    last_end = next_pos
-                else:
-                    # For transformation, apply the replacement
-                    args = text[paren_start_in_text : paren_end + 1]
-                    result.append(replacement + args)
-                    last_end = paren_end + 1
+            # Transformation: rename the function, then keep scanning inside its arguments
+            result.append(replacement)
+            last_end = paren_start
+            pos = paren_start
 
     # Add remaining text
     result.append(text[last_end:])
     return "".join(result)
 
 
-# Improved patterns that will work with the safe replacement function
-PRINT_TRANSFORM_PATTERN = re.compile(r"\bprint\s*(?=\()")
-LOG_INFO_TRANSFORM_PATTERN = re.compile(r"\blog\.info\s*(?=\()")
-LOG_WARNING_TRANSFORM_PATTERN = re.compile(r"\blog\.warning\s*(?=\()")
-LOG_ERROR_TRANSFORM_PATTERN = re.compile(r"\blog\.error\s*(?=\()")
-LOG_OTHER_REMOVAL_PATTERN = re.compile(r"\blog\.[a-zA-Z_][a-zA-Z0-9_]*\s*(?=\()")
+# print and log.* calls, found in one pass. print/log.info/log.warning/log.error are mapped to their DCS
+# equivalents by LOG_CALL_REPLACEMENTS; other log.* calls are removed.
+LOG_CALL_PATTERN = re.compile(r"\b(print|log\.info|log\.warning|log\.error|log\.[a-zA-Z_][a-zA-Z0-9_]*)\s*(?=\()")
+LOG_CALL_REPLACEMENTS = {
+    "print": "env.info",
+    "log.info": "env.info",
+    "log.warning": "env.warning",
+    "log.error": "env.error",
+}
 
 # Pattern to find the loadlib call for warning messages
 LOADLIB_CALL_PATTERN = re.compile(r"\bloadlib\s*\(.*?\)(?:\s*;)?")
 # Pattern to remove the entire line containing loadlib
 LOADLIB_LINE_REMOVAL_PATTERN = re.compile(r"^[ \t]*[^\r\n]*\bloadlib\b[^\r\n]*\r?\n?", re.MULTILINE)
 
+# All whole-line removals combined, so the content is scanned once however many patterns there are.
+# loadlib lines come first, in their own group, so that their removal can be warned about.
+DISALLOWED_LINES_PATTERN = re.compile(
+    "|".join([f"(?P<loadlib>{LOADLIB_LINE_REMOVAL_PATTERN.pattern})", *(f"(?:{p})" for p in DISALLOWED_LINE_PATTERNS)]),
+    re.MULTILINE,
+)
+
+# A word that every DISALLOWED_LINES_PATTERN match contains; content with none of them cannot match it.
+# Keep in sync with DISALLOWED_LINE_PATTERNS.
+DISALLOWED_LINE_KEYWORDS = ("loadlib", "package")
+
 
 def find_lua_files(src_dir):
-    """Finds all .lua files in the source directory."""
+    """Finds all .lua files in the source directory.
+
+    Walks the tree with os.scandir, relying on the cached directory entry types instead of a stat per file.
+    Symlinked directories are not followed.
+    """
     lua_files = []
-    for root, _, files in os.walk(src_dir):
-        for file in files:
-            if file.endswith(".lua"):
-                lua_files.append(Path(root) / file)
+    pending_dirs = [os.fspath(src_dir)]
+    while pending_dirs:
+        with os.scandir(pending_dirs.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending_dirs.append(entry.path)
+                elif entry.name.endswith(".lua") and entry.is_file():
+                    lua_files.append(Path(entry.path))
     return lua_files
 
 
 def get_module_name_from_path(file_path, src_dir_path):
     """Converts a file path to a Lua module name (assuming .lua extension)."""
-    relative_path = file_path.relative_to(src_dir_path)
-    return str(relative_path.with_suffix("")).replace(os.sep, ".")
+    file_str = os.fspath(file_path)
+    src_prefix = os.path.join(os.fspath(src_dir_path), "")
+    if isinstance(file_path, PurePath) and isinstance(src_dir_path, PurePath) and file_str.startswith(src_prefix):
+        # Both paths are already normalized, so plain string slicing gives the relative path
+        relative_path = file_str[len(src_prefix) :]
+    else:
+        relative_path = str(Path(file_path).relative_to(src_dir_path))
+    return os.path.splitext(relative_path)[0].replace(os.sep, ".")
 
 
 def get_path_from_module_name(module_name, src_dir_path):
     """Converts a Lua module name to a file path."""
-    return src_dir_path / Path(module_name.replace(".", os.sep) + ".lua")
+    return src_dir_path / (module_name.replace(".", os.sep) + ".lua")
+
+
+# Lua tokens, as far as the composer needs to tell them apart. Whitespace and comments are matched so they
+# can be skipped, and string literals so that nothing inside them is mistaken for code.
+_LUA_TOKEN_PATTERN = re.compile(
+    r"""
+      (?P<space>\s+)
+    | (?P<comment>--\[(?P<comment_level>=*)\[.*?\](?P=comment_level)\]|--[^\r\n]*)
+    | (?P<long_string>\[(?P<string_level>=*)\[.*?\](?P=string_level)\])
+    | (?P<string>"(?:\\.|[^"\\\r\n])*"|'(?:\\.|[^'\\\r\n])*')
+    | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<number>0[xX][0-9a-fA-F.]+(?:[pP][+-]?\d+)?|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<op>\.\.\.|\.\.|::|\S)
+""",
+    re.VERBOSE | re.DOTALL,
+)
 
+# Libraries that are unavailable (or unsafe) in a sanitized DCS mission environment
+DCS_RESTRICTED_LIBRARIES = frozenset(("os", "io", "lfs"))
+
+# Every name the strict checks can reject; text containing none of these words needs no scan
+_STRICT_CHECK_PROBE = re.compile(r"\b(?:goto|os|io|lfs)\b", re.ASCII)
+
+
+def _needs_lua_checks(content, dcs_strict_sanitize):
+    """Cheap textual probe: False if `content` cannot contain anything the goto/strict DCS checks reject."""
+    if dcs_strict_sanitize:
+        return _STRICT_CHECK_PROBE.search(content) is not None
+    return "goto" in content
+
+
+def _lex_lua(content):
+    """Tokenizes Lua source into (kind, text, line) tuples, skipping whitespace and comments.
+
+    Kinds are "name", "string", "number" and "op". For strings, `text` is the literal's contents
+    without quotes or long brackets (escape sequences are left as written).
+    """
+    tokens = []
+    line = 1
+    for match in _LUA_TOKEN_PATTERN.finditer(content):
+        kind = match.lastgroup
+        text = match.group()
+        if kind == "string":
+            tokens.append(("string", text[1:-1], line))
+        elif kind == "long_string":
+            level = len(match.group("string_level"))
+            value = text[level + 2 : -(level + 2)]
+            # As in Lua, a newline directly after the opening long bracket is not part of the string
+            if value.startswith("\r\n"):
+                value = value[2:]
+            elif value.startswith("\n"):
+                value = value[1:]
+            tokens.append(("string", value, line))
+        elif kind in ("name", "number", "op"):
+            tokens.append((kind, text, line))
+        line += text.count("\n")
+    return tokens
+
+
+def _source_line(content, line_num):
+    """Returns the stripped text of a 1-based line of `content`, for error messages."""
+    if line_num < 1:
+        return ""
+    lines = content.split("\n", line_num)  # Nothing past the wanted line needs splitting
+    return lines[line_num - 1].strip() if line_num <= len(lines) else ""
+
+
+def _is_field_access(tokens, i):
+    """True if the name token at index i follows '.' or ':' (a field or method name, not a variable)."""
+    return i > 0 and tokens[i - 1][0] == "op" and tokens[i - 1][1] in (".", ":")
+
+
+def _find_required_modules(tokens):
+    """Returns the module names required with a string literal: require "x", require 'x' or require("x")."""
+    modules = set()
+    for i, (kind, text, _) in enumerate(tokens):
+        if kind != "name" or text != "require" or _is_field_access(tokens, i):
+            continue
+        following = tokens[i + 1 : i + 4]
+        if following and following[0][0] == "string":
+            modules.add(following[0][1])
+        elif (
+            len(following) == 3
+            and following[0][:2] == ("op", "(")
+            and following[1][0] == "string"
+            and following[2][:2] in (("op", ")"), ("op", ","))
+        ):
+            modules.add(following[1][1])
+    return modules
+
+
+def _check_lua_tokens(tokens, content, file_path, dcs_strict_sanitize):
+    """Raises on goto statements and, if `dcs_strict_sanitize`, on use of the os, io and lfs libraries."""
+    for i, (kind, text, line_num) in enumerate(tokens):
+        if kind != "name" or _is_field_access(tokens, i):
+            continue
 
-def parse_dependencies(file_path, src_dir_path):
-    """Parses a Lua file to find its dependencies (required modules) using luaparser."""
-    dependencies = set()
+        # 1. Goto Check (always active for Lua modules)
+        if text == "goto":
+            raise Exception(
+                f"Disallowed 'goto' statement found in {file_path} on line {line_num}: {_source_line(content, line_num)}"
+            )
+
+        # 2. Strict DCS Sanitization Checks (if enabled)
+        if dcs_strict_sanitize and text in DCS_RESTRICTED_LIBRARIES:
+            offending_id = None
+            next_kind, next_text, _ = tokens[i + 1] if i + 1 < len(tokens) else (None, None, None)
+            if next_kind == "op" and next_text == ".":
+                # os.time
+                idx_token = tokens[i + 2] if i + 2 < len(tokens) else None
+                idx_text = idx_token[1] if idx_token and idx_token[0] == "name" else "complex_index"
+                offending_id = f"{text}.{idx_text}"
+            elif next_kind == "op" and next_text == "[":
+                # os["time"] or os[expr]
+                idx_token = tokens[i + 2] if i + 2 < len(tokens) else None
+                closing = tokens[i + 3] if i + 3 < len(tokens) else None
+                if idx_token and idx_token[0] == "string" and closing and closing[:2] == ("op", "]"):
+                    offending_id = f"{text}.{idx_token[1]}"
+                else:
+                    offending_id = f"{text}.complex_index"
+            elif next_kind == "string" or (next_kind == "op" and next_text in ("(", "{")):
+                # os(...), os "..." or os {...}
+                offending_id = text + "() call pattern (potential direct library call)"
+
+            if offending_id:
+                raise Exception(
+                    f"Disallowed DCS API usage ({offending_id}) found in {file_path} on line {line_num}: "
+                    f"{_source_line(content, line_num)}"
+                )
+
+
+class _NullWriter(io.TextIOBase):
+    """Text stream that discards everything written to it."""
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        return len(s)
+
+
+_NULL_WRITER = _NullWriter()
+
+
+@functools.lru_cache(maxsize=128)
+def _parse_lua(content):
+    """Parses Lua source with luaparser, discarding anything the parser prints to stdout.
+
+    Trees are memoized by content (and only read, never modified), so the same source is parsed once per process.
+    """
+    with contextlib.redirect_stdout(_NULL_WRITER):
+        return ast.parse(content)
+
+
+def _node_source_line(node, content):
+    """Returns (line number, stripped source line(s)) of a luaparser node, for error messages."""
+    line_num = node.first_token.line if node.first_token else "unknown"
+    line_text = ""
+    if node.start_char is not None and node.stop_char is not None:
+        line_start = content.rfind("\n", 0, node.start_char) + 1
+        line_end = content.find("\n", node.stop_char)
+        if line_end == -1:
+            line_end = len(content)
+        line_text = content[line_start:line_end].strip()
+    return line_num, line_text
+
+
+def _check_goto_node(node, content, file_path):
+    line_num, offending_line_text = _node_source_line(node, content)
+    raise Exception(f"Disallowed 'goto' statement found in {file_path} on line {line_num}: {offending_line_text}")
+
+
+def _check_call_node(node, content, file_path):
+    if isinstance(node.func, astnodes.Name) and node.func.id in DCS_RESTRICTED_LIBRARIES:
+        _raise_dcs_api_usage(node.func.id + "() call pattern (potential direct library call)", node, content, file_path)
+
+
+def _check_index_node(node, content, file_path):
+    if isinstance(node.value, astnodes.Name) and node.value.id in DCS_RESTRICTED_LIBRARIES:
+        idx_text = (
+            node.idx.s
+            if isinstance(node.idx, astnodes.String)
+            else (node.idx.id if isinstance(node.idx, astnodes.Name) else "complex_index")
+        )
+        _raise_dcs_api_usage(f"{node.value.id}.{idx_text}", node, content, file_path)
+
+
+def _raise_dcs_api_usage(offending_id, node, content, file_path):
+    line_num, err_line_text = _node_source_line(node, content)
+    raise Exception(
+        f"Disallowed DCS API usage ({offending_id}) found in {file_path} on line {line_num}: {err_line_text}"
+    )
+
+
+# Strict-mode node checks by exact node type, so _check_lua_tree does a single dict lookup for the (many)
+# other nodes. goto is always disallowed; os/io/lfs calls and indexing (loadlib is handled separately) only
+# in strict mode.
+_STRICT_NODE_CHECKERS = {
+    astnodes.Goto: _check_goto_node,
+    astnodes.Call: _check_call_node,
+    astnodes.Index: _check_index_node,
+}
+
+
+def _check_lua_tree(tree, content, file_path, dcs_strict_sanitize):
+    """luaparser counterpart of `_check_lua_tokens`, used with `use_luaparser`."""
+    if not dcs_strict_sanitize:
+        # Only goto is checked, so just look for the first Goto node
+        goto_node = next((node for node in ast.walk(tree) if type(node) is astnodes.Goto), None)
+        if goto_node is not None:
+            _check_goto_node(goto_node, content, file_path)
+        return
+
+    for node in ast.walk(tree):
+        checker = _STRICT_NODE_CHECKERS.get(type(node))
+        if checker is not None:
+            checker(node, content, file_path)
+
+
+def _scan_lua_source(content, use_luaparser=False):
+    """Scans Lua source once, so the result can be shared by parse_dependencies and sanitize_content.
+
+    Returns (tokens, tree); only one of them is set, depending on `use_luaparser`.
+    """
+    if not use_luaparser:
+        return _lex_lua(content), None
     try:
-        with open(file_path, encoding="utf-8") as f:
-            content = f.read()
+        tree = _parse_lua(content)
+    except Exception:
+        # Leave reporting to the consumers, which re-parse (and report) when no tree is supplied.
+        tree = None
+    return None, tree
 
-        # print(f"DEBUG: Calling ast.parse in PARSE_DEPENDENCIES for {file_path}") # Optional debug
 
-        # Suppress stdout during ast.parse
-        old_stdout = sys.stdout
-        sys.stdout = io.StringIO()
-        try:
-            tree = ast.parse(content)
-        finally:
-            sys.stdout = old_stdout  # Restore stdout
-            # captured_str = captured_output.getvalue() # For debugging the suppressed output
-            # if captured_str: print(f"Suppressed from parse_dependencies({file_path}): {captured_str}")
-
-        for node in ast.walk(tree):
-            if isinstance(node, astnodes.Call) and isinstance(node.func, astnodes.Name) and node.func.id == "require":
-                if node.args and isinstance(node.args[0], astnodes.String):
-                    dependencies.add(node.args[0].s)
+# Bump whenever scanning or sanitization output changes, so stale on-disk cache entries are ignored.
+COMPOSER_CACHE_VERSION = "3"
+
+
+# Name of the cache file that maps source paths to (mtime_ns, size, content digest), so unchanged files need not be read.
+STAT_INDEX_NAME = "stat-index.json"
+
+# A file modified this close to the moment the stat index is written could still be edited again within the same
+# timestamp tick without changing size. As with git's "racy" index entries, such files are left out of the index and
+# re-hashed on the next build rather than trusted by their stat alone.
+STAT_INDEX_RACY_WINDOW_NS = 2_000_000_000
+
+
+def _content_digest(content):
+    """Returns a digest identifying Lua source content."""
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _source_cache_key(content_digest, dcs_strict_sanitize, use_luaparser):
+    """Returns the cache key for the scan results of content with the given digest under the given build settings.
+
+    The results depend only on the content, not on the file's path, so moved or duplicated files share an entry.
+    """
+    key_material = f"{COMPOSER_CACHE_VERSION}\0{dcs_strict_sanitize}\0{use_luaparser}\0{content_digest}"
+    return hashlib.blake2b(key_material.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _load_cache_entry(cache_dir, key):
+    """Returns the cached {"deps": [...], "sanitized": "..."} entry for `key`, or None on a miss."""
+    try:
+        with open(Path(cache_dir) / f"{key}.json", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or not isinstance(entry.get("deps"), list) or "sanitized" not in entry:
+        return None
+    return entry
+
+
+def _store_cache_entry(cache_dir, key, deps, sanitized):
+    """Writes a cache entry. Failing to write the cache is reported but never fails the build."""
+    cache_dir = Path(cache_dir)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_dir / f"{key}.json.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"deps": sorted(deps), "sanitized": sanitized}, f)
+        os.replace(tmp_path, cache_dir / f"{key}.json")
+    except OSError as e:
+        print(f"Warning: could not write composer cache entry to {cache_dir}: {e}")
+
+
+def _load_stat_index(cache_dir):
+    """Returns the cached {path: [mtime_ns, size, content digest]} index, or an empty dict if there is none."""
+    try:
+        with open(Path(cache_dir) / STAT_INDEX_NAME, encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(index, dict) or index.get("version") != COMPOSER_CACHE_VERSION:
+        return {}
+    files = index.get("files")
+    return files if isinstance(files, dict) else {}
+
+
+def _store_stat_index(cache_dir, files):
+    """Writes the stat index. Like cache entries, failing to write it is reported but never fails the build."""
+    cache_dir = Path(cache_dir)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_dir / f"{STAT_INDEX_NAME}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": COMPOSER_CACHE_VERSION, "files": files}, f)
+        os.replace(tmp_path, cache_dir / STAT_INDEX_NAME)
+    except OSError as e:
+        print(f"Warning: could not write composer cache index to {cache_dir}: {e}")
+
+
+def parse_dependencies(file_path, src_dir_path, content=None, tokens=None, tree=None, use_luaparser=False):
+    """Finds a Lua file's dependencies (required modules).
+
+    The file is tokenized with `_lex_lua`, or parsed with luaparser if `use_luaparser` is set.
+    If the file's content, tokens and/or parsed tree are already available they can be passed in
+    to avoid reading and scanning the file again.
+    """
+    dependencies = set()
+    try:
+        if content is None and (tree if use_luaparser else tokens) is None:
+            content = Path(file_path).read_text(encoding="utf-8")
+        if content is not None and "require" not in content:
+            return dependencies  # Nothing to find; skip scanning or walking the file
+
+        if use_luaparser:
+            if tree is None:
+                tree = _parse_lua(content)
+            for node in ast.walk(tree):
+                if (
+                    isinstance(node, astnodes.Call)
+                    and isinstance(node.func, astnodes.Name)
+                    and node.func.id == "require"
+                ):
+                    if node.args and isinstance(node.args[0], astnodes.String):
+                        dependencies.add(node.args[0].s)
+        else:
+            if tokens is None:
+                tokens = _lex_lua(content)
+            dependencies.update(_find_required_modules(tokens))
     except Exception as e:
-        print(f"Error reading or parsing dependencies from {file_path} with luaparser: {e}")
+        print(f"Error reading or parsing dependencies from {file_path}: {e}")
     return dependencies
 
 
+def _find_dependency_cycle(names, index_of, placed, dependencies_graph):
+    """Returns one dependency cycle among the modules a topological sort could not place, e.g. [A, C, B, A].
+
+    Every unplaced module has an unplaced dependency, so following those from any of them must loop back.
+    """
+    position_in_path = {}
+    path = []
+    i = placed.index(False)
+    while i not in position_in_path:
+        position_in_path[i] = len(path)
+        path.append(i)
+        i = min(index_of[dep] for dep in dependencies_graph[names[i]] if dep in index_of and not placed[index_of[dep]])
+    return [names[j] for j in path[position_in_path[i] :]] + [names[i]]
+
+
 def topological_sort(dependencies_graph, all_modules_to_sort, module_to_path_map):
-    """Performs a topological sort on the dependency graph with directory-affinity tie-breaking."""
-    in_degree = dict.fromkeys(all_modules_to_sort, 0)
-    adj = defaultdict(list)
-    # Using a list for the queue to allow for selective picking
-    processing_queue = []
-    sorted_order = []
+    """Performs a topological sort on the dependency graph with directory-affinity tie-breaking.
+
+    Among the modules whose dependencies are all placed, the alphabetically first one in the same
+    directory as the previously placed module wins; otherwise the alphabetically first overall.
+    """
+    # Modules are handled as indices into the sorted list of names, so index order is alphabetical order
+    names = sorted(all_modules_to_sort)
+    index_of = {module: i for i, module in enumerate(names)}
+    in_degree = [0] * len(names)
+    adj = [[] for _ in names]
+    parent_dir = [Path(module_to_path_map[module]).parent for module in names]
+    # Ready modules are kept in a global heap and in a heap per directory. A module placed via one heap
+    # is left in the other and skipped when it surfaces there (lazy deletion).
+    ready_queue = []
+    ready_by_directory = {directory: [] for directory in set(parent_dir)}
+    placed = [False] * len(names)
+    sorted_indices = []
     current_directory_context = None
 
+    def mark_ready(i):
+        heapq.heappush(ready_queue, i)
+        heapq.heappush(ready_by_directory[parent_dir[i]], i)
+
+    def pop_ready(heap):
+        while heap:
+            i = heapq.heappop(heap)
+            if not placed[i]:
+                return i
+        return None
+
     # Build adjacency list and in_degree count
     for module, deps in dependencies_graph.items():
-        if module not in all_modules_to_sort:
+        module_index = index_of.get(module)
+        if module_index is None:
             continue
         for dep in deps:
-            if dep in all_modules_to_sort:
-                adj[dep].append(module)
-                in_degree[module] += 1
+            dep_index = index_of.get(dep)
+            if dep_index is not None:
+                adj[dep_index].append(module_index)
+                in_degree[module_index] += 1
 
     # Initialize queue with nodes having in_degree 0
-    for module in all_modules_to_sort:
-        if in_degree[module] == 0:
-            processing_queue.append(module)
-
-    processing_queue.sort()  # Initial sort for deterministic behavior if no context yet
+    for i, degree in enumerate(in_degree):
+        if degree == 0:
+            mark_ready(i)
 
     # Process queue
-    while processing_queue:
-        module_to_process = None
+    while True:
+        index_to_process = None
         # Try to find a module in the current directory context
-        if current_directory_context:
-            context_candidates = sorted(
-                [m for m in processing_queue if Path(module_to_path_map[m]).parent == current_directory_context]
-            )
-            if context_candidates:
-                module_to_process = context_candidates[0]
+        if current_directory_context is not None:
+            index_to_process = pop_ready(ready_by_directory[current_directory_context])
 
         # If no module found in current context, or no context yet, pick from the whole queue (alphabetically)
-        if not module_to_process:
-            # Ensure queue is sorted for deterministic fallback pick
-            processing_queue.sort()
-            module_to_process = processing_queue[0]
-
-        processing_queue.remove(module_to_process)
-        sorted_order.append(module_to_process)
-        current_directory_context = Path(module_to_path_map[module_to_process]).parent
+        if index_to_process is None:
+            index_to_process = pop_ready(ready_queue)
+            if index_to_process is None:
+                break
 
-        # Sort neighbors to process them in a deterministic order for adding to queue
-        # This primarily affects which modules *become available* next, influencing future tie-breaks.
-        sorted_neighbors = sorted(adj[module_to_process])
+        placed[index_to_process] = True
+        sorted_indices.append(index_to_process)
+        current_directory_context = parent_dir[index_to_process]
 
-        for neighbor in sorted_neighbors:
+        for neighbor in adj[index_to_process]:
             in_degree[neighbor] -= 1
             if in_degree[neighbor] == 0:
-                processing_queue.append(neighbor)
-                # Keep the queue sorted for consistent picking when context doesn't apply
-                # or when picking the first from a context set.
-                # This could be optimized, but ensures determinism.
-                processing_queue.sort()
+                mark_ready(neighbor)
 
+    sorted_order = [names[i] for i in sorted_indices]
     if len(sorted_order) != len(all_modules_to_sort):
         missing_from_sorted = all_modules_to_sort - set(sorted_order)
-        problematic_modules = {mod for mod, degree in in_degree.items() if degree > 0}
+        problematic_modules = {names[i] for i, degree in enumerate(in_degree) if degree > 0}
         raise Exception(
             f"Circular dependency detected or missing modules among core modules. "
+            f"Cycle: {' -> '.join(_find_dependency_cycle(names, index_of, placed, dependencies_graph))}. "
             f"Processed: {len(sorted_order)}/{len(all_modules_to_sort)}. "
             f"Problematic modules (involved in cycle or with unresolved deps): {problematic_modules}. "
             f"Modules not included in sorted output: {missing_from_sorted}"
@@ -261,105 +635,52 @@ def topological_sort(dependencies_graph, all_modules_to_sort, module_to_path_map
     return sorted_order
 
 
-def sanitize_content(content, file_path, is_lua_module=True, dcs_strict_sanitize=True):
-    """Removes or replaces disallowed Lua statements. Uses luaparser for goto and optional strict DCS checks."""
+def sanitize_content(
+    content, file_path, is_lua_module=True, dcs_strict_sanitize=True, tokens=None, tree=None, use_luaparser=False
+):
+    """Removes or replaces disallowed Lua statements. Rejects goto and, optionally, os/io/lfs usage (strict DCS checks).
+
+    The checks run on `_lex_lua` tokens, or on a luaparser tree if `use_luaparser` is set.
+    Already-computed tokens (or tree) for `content` may be passed in to skip re-scanning.
+    """
     if not is_lua_module:
         return content
 
-    original_content_for_error_reporting = content  # Keep a copy for error context
-
     try:
-        # print(f"DEBUG: Calling ast.parse in SANITIZE_CONTENT for {file_path}") # Optional debug
-
-        # Suppress stdout during ast.parse for goto check
-        old_stdout_sanitize = sys.stdout
-        sys.stdout = io.StringIO()
-        try:
-            tree = ast.parse(content)
-        finally:
-            sys.stdout = old_stdout_sanitize  # Restore stdout
-            # captured_str_sanitize = captured_output_sanitize.getvalue()
-            # if captured_str_sanitize: print(f"Suppressed from sanitize_content({file_path}): {captured_str_sanitize}")
-
-        for node in ast.walk(tree):
-            # 1. Goto Check (always active for Lua modules)
-            if isinstance(node, astnodes.Goto):
-                line_num = node.first_token.line if node.first_token else "unknown"
-                offending_line_text = ""
-                if node.start_char is not None and node.stop_char is not None:
-                    line_start = original_content_for_error_reporting.rfind("\n", 0, node.start_char) + 1
-                    line_end = original_content_for_error_reporting.find("\n", node.stop_char)
-                    if line_end == -1:
-                        line_end = len(original_content_for_error_reporting)
-                    offending_line_text = original_content_for_error_reporting[line_start:line_end].strip()
-                raise Exception(
-                    f"Disallowed 'goto' statement found in {file_path} on line {line_num}: {offending_line_text}"
-                )
-
-            # 2. Strict DCS Sanitization Checks (if enabled)
-            if dcs_strict_sanitize:
-                # Check for os, io, lfs, usage (loadlib is now handled differently)
-                offending_id = None
-                node_for_error = node  # For line number context
-
-                # Removed direct Name check for os,io,lfs as it was too broad.
-                # Focus on Call and Index for actual library usage.
-
-                if isinstance(node, astnodes.Call):
-                    # if isinstance(node.func, astnodes.Name) and node.func.id == "loadlib":
-                    #     pass # loadlib is now removed with a warning, not a strict error
-                    if isinstance(node.func, astnodes.Name) and node.func.id in [
-                        "os",
-                        "io",
-                        "lfs",
-                    ]:
-                        offending_id = node.func.id + "() call pattern (potential direct library call)"
-
-                if isinstance(node, astnodes.Index) and isinstance(node.value, astnodes.Name):
-                    if node.value.id in ["os", "io", "lfs"]:
-                        idx_text = (
-                            node.idx.s
-                            if isinstance(node.idx, astnodes.String)
-                            else (node.idx.id if isinstance(node.idx, astnodes.Name) else "complex_index")
-                        )
-                        offending_id = f"{node.value.id}.{idx_text}"
-
-                if offending_id:
-                    line_num = node_for_error.first_token.line if node_for_error.first_token else "unknown"
-                    err_line_text = ""
-                    if node_for_error.start_char is not None and node_for_error.stop_char is not None:
-                        line_start = original_content_for_error_reporting.rfind("\n", 0, node_for_error.start_char) + 1
-                        line_end = original_content_for_error_reporting.find("\n", node_for_error.stop_char)
-                        if line_end == -1:
-                            line_end = len(original_content_for_error_reporting)
-                        err_line_text = original_content_for_error_reporting[line_start:line_end].strip()
-                    raise Exception(
-                        f"Disallowed DCS API usage ({offending_id}) found in {file_path} on line {line_num}: {err_line_text}"
-                    )
+        if not _needs_lua_checks(content, dcs_strict_sanitize):
+            pass  # No goto (or, if strict, os/io/lfs) anywhere in the text: nothing for a scan to find
+        elif use_luaparser:
+            if tree is None:
+                tree = _parse_lua(content)
+            _check_lua_tree(tree, content, file_path, dcs_strict_sanitize)
+        else:
+            if tokens is None:
+                tokens = _lex_lua(content)
+            _check_lua_tokens(tokens, content, file_path, dcs_strict_sanitize)
 
-        # Phase 3: Regex-based transformations and removals
+        # Phase 3: Regex-based transformations and removals. Each pass needs a literal keyword to match anything,
+        # so a plain substring test (much cheaper than a regex scan) skips the passes that cannot apply.
         processed_content = content
 
-        # Handle loadlib: Warn and remove (entire line)
-        for match in LOADLIB_CALL_PATTERN.finditer(processed_content):  # Use specific pattern for finding/warning
-            print(f"WARNING: [{file_path}] Disallowed 'loadlib' call found and was removed: {match.group(0)}")
-        processed_content = LOADLIB_LINE_REMOVAL_PATTERN.sub("", processed_content)  # Use line removal pattern for sub
-
         # Remove require statements
-        processed_content = REQUIRE_REMOVAL_PATTERN.sub("", processed_content)
+        if "require" in processed_content:
+            processed_content = REQUIRE_REMOVAL_PATTERN.sub("", processed_content)
 
-        # Remove lines containing the `package` keyword
-        for pattern, replacement in DISALLOWED_LINE_PATTERNS.items():
-            processed_content = pattern.sub(replacement, processed_content)
+        # Remove lines containing loadlib (with a warning) or the `package` keyword, in a single pass. This runs after
+        # require removal, as the package pass always has: the require pattern can consume the newline after a
+        # statement, so removing a following line first would join what is left of the require onto the next line.
+        def remove_disallowed_line(line_match):
+            if line_match.lastgroup == "loadlib":
+                for match in LOADLIB_CALL_PATTERN.finditer(line_match.group(0)):  # Use specific pattern for warning
+                    print(f"WARNING: [{file_path}] Disallowed 'loadlib' call found and was removed: {match.group(0)}")
+            return ""
 
-        # Transform log.* statements using safe replacement
-        processed_content = _safe_regex_replace(LOG_INFO_TRANSFORM_PATTERN, "env.info", processed_content)
-        processed_content = _safe_regex_replace(LOG_WARNING_TRANSFORM_PATTERN, "env.warning", processed_content)
-        processed_content = _safe_regex_replace(LOG_ERROR_TRANSFORM_PATTERN, "env.error", processed_content)
-        processed_content = _safe_regex_replace(LOG_OTHER_REMOVAL_PATTERN, "", processed_content, is_removal=True)
+        if any(keyword in processed_content for keyword in DISALLOWED_LINE_KEYWORDS):
+            processed_content = DISALLOWED_LINES_PATTERN.sub(remove_disallowed_line, processed_content)
 
-        # Transform print statements using safe replacement
-        processed_content = _safe_regex_replace(PRINT_TRANSFORM_PATTERN, "env.info", processed_content)
+        # Transform print and log.* statements (and remove other log.* calls) using safe replacement
+        if "print" in processed_content or "log." in processed_content:
+            processed_content = _safe_regex_replace(LOG_CALL_PATTERN, LOG_CALL_REPLACEMENTS, processed_content)
 
         return processed_content
 
@@ -370,6 +691,76 @@ def sanitize_content(content, file_path, is_lua_module=True, dcs_strict_sanitize
         return content
 
 
+# Below this many modules to process, a process pool costs more to start than it saves.
+PARALLEL_MODULE_THRESHOLD = 64
+
+
+def _read_sources(paths):
+    """Reads Lua source files into a {path: content} dict.
+
+    Large projects are read on a thread pool, so that waiting on one file (e.g. a cold disk cache on CI) overlaps
+    with reading the others.
+    """
+    if len(paths) < PARALLEL_MODULE_THRESHOLD:
+        return {path: path.read_text(encoding="utf-8") for path in paths}
+    with ThreadPoolExecutor(max_workers=min(16, len(paths))) as executor:
+        return dict(zip(paths, executor.map(functools.partial(Path.read_text, encoding="utf-8"), paths)))
+
+
+def _process_lua_module(file_path, content, src_dir_path, dcs_strict_sanitize, use_luaparser):
+    """Scans and sanitizes one core module. Returns (dependencies, sanitized content, sanitization error).
+
+    A sanitization error (e.g. a disallowed goto) is returned rather than raised. It is raised only when the
+    module is emitted, as if sanitization had happened then, and this also lets the function run in a worker.
+    """
+    tokens = tree = None
+    if "require" in content or _needs_lua_checks(content, dcs_strict_sanitize):
+        tokens, tree = _scan_lua_source(content, use_luaparser)
+    deps = parse_dependencies(
+        file_path, src_dir_path, content=content, tokens=tokens, tree=tree, use_luaparser=use_luaparser
+    )
+    try:
+        sanitized = sanitize_content(
+            content,
+            file_path,
+            is_lua_module=True,
+            dcs_strict_sanitize=dcs_strict_sanitize,
+            tokens=tokens,
+            tree=tree,
+            use_luaparser=use_luaparser,
+        )
+    except Exception as e:
+        return deps, None, e
+    return deps, sanitized, None
+
+
+def _process_lua_modules(modules, src_dir_path, dcs_strict_sanitize, use_luaparser):
+    """Runs _process_lua_module for each (path, content) pair, in a process pool for large projects.
+
+    Results are returned in the order of `modules`.
+    """
+    worker_count = min(os.cpu_count() or 1, len(modules))
+    if len(modules) < PARALLEL_MODULE_THRESHOLD or worker_count < 2:
+        return [
+            _process_lua_module(path, content, src_dir_path, dcs_strict_sanitize, use_luaparser)
+            for path, content in modules
+        ]
+
+    paths, contents = zip(*modules)
+    with ProcessPoolExecutor(max_workers=worker_count) as executor:
+        return list(
+            executor.map(
+                _process_lua_module,
+                paths,
+                contents,
+                repeat(src_dir_path),
+                repeat(dcs_strict_sanitize),
+                repeat(use_luaparser),
+                chunksize=max(1, len(modules) // (worker_count * 4)),
+            )
+        )
+
+
 def build_project(
     src_dir,
     output_file,
@@ -380,7 +771,14 @@ def build_project(
     dcs_strict_sanitize=True,
     dependencies_config=None,
     scope="global",
+    use_luaparser=False,
+    cache_dir=None,
 ):
+    """Builds the combined Lua file.
+
+    If `cache_dir` is given, each core module's dependencies and sanitized output are cached there,
+    keyed by its content and the build settings, so unchanged modules are not re-scanned.
+    """
     src_dir_path = Path(src_dir).resolve()
     output_file_path = Path(output_file).resolve()
     output_file_path.parent.mkdir(parents=True, exist_ok=True)
@@ -435,13 +833,85 @@ def build_project(
     core_module_names_to_sort = {path_to_module[p] for p in core_module_paths if p in path_to_module}
 
     dependencies_graph = {}
+    # Each core module is read, scanned and sanitized once, up front; modules found in the cache (if enabled)
+    # are not processed at all. Results are (dependencies, sanitized content, sanitization error).
+    core_module_results = {}
+    pending_modules = []  # (module name, path, content, digest, cache key) of modules that need processing
+    # Files whose size and mtime match the stat index are known by their digest, so a cache hit needs no read at all
+    stat_index = _load_stat_index(cache_dir) if cache_dir else {}
+    new_stat_index = {}
+    module_stats = {}
+    indexed_digests = {}
+    if cache_dir:
+        for core_module_path_item in core_module_paths:
+            st = module_stats[core_module_path_item] = core_module_path_item.stat()
+            indexed = stat_index.get(str(core_module_path_item))
+            if isinstance(indexed, list) and indexed[:2] == [st.st_mtime_ns, st.st_size] and len(indexed) == 3:
+                indexed_digests[core_module_path_item] = indexed[2]
+    # Every other module has to be read to find out whether it changed
+    module_contents = _read_sources([p for p in core_module_paths if p not in indexed_digests])
+
     for core_module_path_item in core_module_paths:
         # Ensure it's a module we can get a name for (should always be true here)
         core_module_name_item = path_to_module.get(core_module_path_item)
         if not core_module_name_item:
             continue
 
-        deps = parse_dependencies(core_module_path_item, src_dir_path)
+        content = module_contents.get(core_module_path_item)
+        digest = indexed_digests.get(core_module_path_item)
+        if digest is None:
+            digest = _content_digest(content)
+        cache_key = None
+        if cache_dir:
+            st = module_stats[core_module_path_item]
+            new_stat_index[str(core_module_path_item)] = [st.st_mtime_ns, st.st_size, digest]
+            cache_key = _source_cache_key(digest, dcs_strict_sanitize, use_luaparser)
+            cache_entry = _load_cache_entry(cache_dir, cache_key)
+            if cache_entry:
+                core_module_results[core_module_name_item] = (
+                    set(cache_entry["deps"]),
+                    cache_entry["sanitized"],
+                    None,
+                )
+                continue
+        if content is None:  # Unchanged according to the stat index, but its cache entry is gone
+            content = core_module_path_item.read_text(encoding="utf-8")
+        pending_modules.append((core_module_name_item, core_module_path_item, content, digest, cache_key))
+        core_module_results[core_module_name_item] = None  # Filled in below; keeps modules in discovery order
+    cache_hits = len(core_module_results) - len(pending_modules)
+
+    # Modules with identical content (e.g. stub init.lua files) are processed once and share the result
+    first_with_hash = {}
+    for i, pending_module in enumerate(pending_modules):
+        first_with_hash.setdefault(pending_module[3], i)
+    unique_indices = list(first_with_hash.values())
+    unique_results = dict(
+        zip(
+            unique_indices,
+            _process_lua_modules(
+                [pending_modules[i][1:3] for i in unique_indices], src_dir_path, dcs_strict_sanitize, use_luaparser
+            ),
+        )
+    )
+    for i, (module_name, core_module_path_item, content, digest, cache_key) in enumerate(pending_modules):
+        result = unique_results[first_with_hash[digest]]
+        if i not in unique_results and (result[2] is not None or "loadlib" in content):
+            # Errors and loadlib warnings name the file they were found in, so such duplicates get their own run
+            result = _process_lua_module(
+                core_module_path_item, content, src_dir_path, dcs_strict_sanitize, use_luaparser
+            )
+        core_module_results[module_name] = result
+        deps, sanitized, error = result
+        # Modules with loadlib calls are left uncached so their removal warning is printed on every build
+        if cache_key and error is None and "loadlib" not in content:
+            _store_cache_entry(cache_dir, cache_key, deps, sanitized)
+    if cache_dir:
+        racy_after_ns = time.time_ns() - STAT_INDEX_RACY_WINDOW_NS
+        new_stat_index = {path: entry for path, entry in new_stat_index.items() if entry[0] < racy_after_ns}
+        if new_stat_index != stat_index:
+            _store_stat_index(cache_dir, new_stat_index)
+
+    for core_module_name_item, (deps, _, _) in core_module_results.items():
         dependencies_graph[core_module_name_item] = {
             dep
             for dep in deps
@@ -456,6 +926,8 @@ def build_project(
         print("Dependencies for core modules:")
         for mod, deps in dependencies_graph.items():
             print(f"  {mod}: {deps if deps else '{}'}")
+    if cache_dir:
+        print(f"Composer cache: {cache_hits}/{len(core_module_results)} core modules reused from {cache_dir}")
     print("-" * 30)
 
     sorted_core_module_names = []
@@ -469,152 +941,152 @@ def build_project(
             return
 
     # --- Construct the final output ---
-    final_lua_code = []
-
-    # 1. Optional Header File Content (verbatim - no strict sanitization applied here by default rule)
-    if header_path and header_path.is_file():
-        with open(header_path, encoding="utf-8") as f:
-            # Headers are typically non-Lua or special; dcs_strict_sanitize probably shouldn't apply here by default
-            final_lua_code.append(
-                sanitize_content(
-                    f.read(),
-                    header_path,
-                    is_lua_module=False,
-                    dcs_strict_sanitize=False,
-                )
-            )
-        final_lua_code.append("\n")
-
-    # 2. Process and inject external dependencies
-    if dependencies_config:
-        print("\nProcessing external dependencies...")
-        dep_manager = DependencyManager()
-        dependencies = load_dependencies_config({"dependencies": dependencies_config})
-
-        for dep in dependencies:
-            print(f"  - Fetching dependency: {dep.name}")
-            try:
-                # Use the current working directory as base for local dependencies
-                # This allows dependencies to be anywhere in the repository
-                lua_content, license_content = dep_manager.fetch_dependency(dep, Path.cwd())
-                # Sanitize the dependency content
-                sanitized_lua = sanitize_content(
-                    lua_content,
-                    Path(f"dependency_{dep.name}.lua"),
-                    is_lua_module=True,
-                    dcs_strict_sanitize=dcs_strict_sanitize,
-                )
-                # Format and add the dependency block
-                dep_block = dep_manager.format_dependency_block(dep, sanitized_lua, license_content)
-                final_lua_code.append(dep_block)
-                final_lua_code.append("\n")
-            except Exception as e:
-                print(f"  ERROR: Failed to process dependency '{dep.name}': {e}")
-                raise
-
-    # 3. Autogenerated Build Information
-    current_time_utc = datetime.datetime.now(tz=datetime.timezone.utc)
-    final_lua_code.append(f"-- Combined and Sanitized Lua script generated on {current_time_utc.isoformat()}\n")
-    final_lua_code.append("-- THIS IS A RELEASE FILE. DO NOT EDIT THIS FILE DIRECTLY. EDIT SOURCE FILES AND REBUILD.\n")
-    if header_file_rel:
-        final_lua_code.append(f"-- Header File: {header_file_rel}\n")
-    if dependencies_config:
-        final_lua_code.append(f"-- External Dependencies: {len(dependencies_config)} loaded\n")
-    final_lua_code.append(f"-- Namespace File: {namespace_file_rel}\n")
-    final_lua_code.append(f"-- Entrypoint File: {entrypoint_file_rel}\n")
-    if footer_file_rel:
-        final_lua_code.append(f"-- Footer File: {footer_file_rel}\n")
-    final_lua_code.append(
-        f"-- Core Modules Order: {', '.join(sorted_core_module_names) if sorted_core_module_names else 'None'}\n"
-    )
-    final_lua_code.append(f"-- Scope: {scope}\n")
-    final_lua_code.append("\n")
-
-    # Start local scope if requested (after build info, excluding header)
-    if scope == "local":
-        final_lua_code.append("-- Beginning of local scope\n")
-        final_lua_code.append("do\n")
-        final_lua_code.append("\n")
-
-    # 4. Required Namespace File Content (sanitized)
-    final_lua_code.append(f"-- Namespace Content from: {namespace_path.relative_to(src_dir_path)}\n")
-    with open(namespace_path, encoding="utf-8") as f:
-        final_lua_code.append(
-            sanitize_content(
-                f.read(),
-                namespace_path,
-                is_lua_module=True,
-                dcs_strict_sanitize=dcs_strict_sanitize,
-            )
-        )
-    final_lua_code.append("\n")
-
-    # 5. Core Modules Content (topologically sorted and sanitized)
-    if sorted_core_module_names:
-        print("\nFinal calculated loading order for core modules:")
-        for i, module_name in enumerate(sorted_core_module_names):
-            print(f"  {i + 1}. {module_name} (Path: {module_to_path[module_name].relative_to(src_dir_path)})")
-
-        for module_name in sorted_core_module_names:
-            file_path = module_to_path[module_name]
-            final_lua_code.append(f"\n-- Core Module Content from: {file_path.relative_to(src_dir_path)}\n")
-            final_lua_code.append(f"-- Module Name: {module_name}\n")
-            with open(file_path, encoding="utf-8") as f:
-                final_lua_code.append(
-                    sanitize_content(
-                        f.read(),
-                        file_path,
+    # The output is generated as a stream of fragments and written to a temporary file next to the
+    # output file, which replaces it only once the whole build has succeeded.
+    def generate_output():
+        # 1. Optional Header File Content (verbatim - no strict sanitization applied here by default rule)
+        if header_path and header_path.is_file():
+            # Headers are typically non-Lua or special, so they are copied as is
+            yield header_path.read_text(encoding="utf-8")
+            yield "\n"
+
+        # 2. Process and inject external dependencies
+        if dependencies_config:
+            print("\nProcessing external dependencies...")
+            dep_manager = DependencyManager()
+            dependencies = load_dependencies_config({"dependencies": dependencies_config})
+            for dep in dependencies:
+                print(f"  - Fetching dependency: {dep.name}")
+            # Use the current working directory as base for local dependencies
+            # This allows dependencies to be anywhere in the repository
+            fetched_dependencies = dep_manager.fetch_all(dependencies, Path.cwd())
+
+            for dep in dependencies:
+                try:
+                    lua_content, license_content = next(fetched_dependencies)
+                    # Sanitize the dependency content
+                    sanitized_lua = sanitize_content(
+                        lua_content,
+                        Path(f"dependency_{dep.name}.lua"),
                         is_lua_module=True,
                         dcs_strict_sanitize=dcs_strict_sanitize,
+                        use_luaparser=use_luaparser,
                     )
-                )
-            final_lua_code.append("\n")
-    else:
-        print("\nNo core modules to process.")
-
-    # 6. Required Entrypoint File Content (sanitized)
-    final_lua_code.append(f"\n-- Entrypoint Content from: {entrypoint_path.relative_to(src_dir_path)}\n")
-    with open(entrypoint_path, encoding="utf-8") as f:
-        final_lua_code.append(
-            sanitize_content(
-                f.read(),
-                entrypoint_path,
-                is_lua_module=True,
-                dcs_strict_sanitize=dcs_strict_sanitize,
-            )
+                    # Format and add the dependency block
+                    dep_block = dep_manager.format_dependency_block(dep, sanitized_lua, license_content)
+                    yield dep_block
+                    yield "\n"
+                except Exception as e:
+                    print(f"  ERROR: Failed to process dependency '{dep.name}': {e}")
+                    raise
+
+        # 3. Autogenerated Build Information
+        current_time_utc = datetime.datetime.now(tz=datetime.timezone.utc)
+        yield f"-- Combined and Sanitized Lua script generated on {current_time_utc.isoformat()}\n"
+        yield "-- THIS IS A RELEASE FILE. DO NOT EDIT THIS FILE DIRECTLY. EDIT SOURCE FILES AND REBUILD.\n"
+        if header_file_rel:
+            yield f"-- Header File: {header_file_rel}\n"
+        if dependencies_config:
+            yield f"-- External Dependencies: {len(dependencies_config)} loaded\n"
+        yield f"-- Namespace File: {namespace_file_rel}\n"
+        yield f"-- Entrypoint File: {entrypoint_file_rel}\n"
+        if footer_file_rel:
+            yield f"-- Footer File: {footer_file_rel}\n"
+        yield f"-- Core Modules Order: {', '.join(sorted_core_module_names) if sorted_core_module_names else 'None'}\n"
+        yield f"-- Scope: {scope}\n"
+        yield "\n"
+
+        # Start local scope if requested (after build info, excluding header)
+        if scope == "local":
+            yield "-- Beginning of local scope\n"
+            yield "do\n"
+            yield "\n"
+
+        # 4. Required Namespace File Content (sanitized)
+        yield f"-- Namespace Content from: {namespace_path.relative_to(src_dir_path)}\n"
+        yield sanitize_content(
+            namespace_path.read_text(encoding="utf-8"),
+            namespace_path,
+            is_lua_module=True,
+            dcs_strict_sanitize=dcs_strict_sanitize,
+            use_luaparser=use_luaparser,
         )
-    final_lua_code.append("\n")
-
-    # End local scope if requested (after entrypoint, before footer)
-    if scope == "local":
-        final_lua_code.append("\n-- End of local scope\n")
-        final_lua_code.append("end\n")
-
-    # 7. Optional Footer File Content (verbatim - no strict sanitization applied here by default rule)
-    if footer_path and footer_path.is_file():
-        final_lua_code.append(f"\n-- Footer Content from: {footer_path.relative_to(src_dir_path)}\n")
-        with open(footer_path, encoding="utf-8") as f:
-            final_lua_code.append(
-                sanitize_content(
-                    f.read(),
-                    footer_path,
-                    is_lua_module=False,
-                    dcs_strict_sanitize=False,
-                )
-            )
-        final_lua_code.append("\n")
+        yield "\n"
+
+        # 5. Core Modules Content (topologically sorted and sanitized)
+        if sorted_core_module_names:
+            # Relative paths are shown twice per module, so compute each once
+            relative_paths = [
+                module_to_path[module_name].relative_to(src_dir_path) for module_name in sorted_core_module_names
+            ]
+            print("\nFinal calculated loading order for core modules:")
+            for i, (module_name, relative_path) in enumerate(zip(sorted_core_module_names, relative_paths)):
+                print(f"  {i + 1}. {module_name} (Path: {relative_path})")
+
+            for module_name, relative_path in zip(sorted_core_module_names, relative_paths):
+                yield f"\n-- Core Module Content from: {relative_path}\n"
+                yield f"-- Module Name: {module_name}\n"
+                _, sanitized, error = core_module_results[module_name]
+                if error is not None:
+                    raise error
+                yield sanitized
+                yield "\n"
+        else:
+            print("\nNo core modules to process.")
+
+        # 6. Required Entrypoint File Content (sanitized)
+        yield f"\n-- Entrypoint Content from: {entrypoint_path.relative_to(src_dir_path)}\n"
+        yield sanitize_content(
+            entrypoint_path.read_text(encoding="utf-8"),
+            entrypoint_path,
+            is_lua_module=True,
+            dcs_strict_sanitize=dcs_strict_sanitize,
+            use_luaparser=use_luaparser,
+        )
+        yield "\n"
+
+        # End local scope if requested (after entrypoint, before footer)
+        if scope == "local":
+            yield "\n-- End of local scope\n"
+            yield "end\n"
+
+        # 7. Optional Footer File Content (verbatim - no strict sanitization applied here by default rule)
+        if footer_path and footer_path.is_file():
+            yield f"\n-- Footer Content from: {footer_path.relative_to(src_dir_path)}\n"
+            yield footer_path.read_text(encoding="utf-8")
+            yield "\n"
 
     # --- Write the output file ---
+    tmp_output_path = output_file_path.with_name(f".{output_file_path.name}.tmp")
     try:
-        with open(output_file_path, "w", encoding="utf-8") as f:
-            f.write("".join(final_lua_code))
+        # A large buffer turns the many small fragment writes into a few large ones
+        output_stream = open(tmp_output_path, "w", encoding="utf-8", buffering=1 << 20)
+    except OSError as e:
+        print(f"Error writing output file {output_file_path}: {e}")
+        return
+
+    line_count = 0
+    with output_stream:
+        try:
+            for fragment in generate_output():
+                output_stream.write(fragment)
+                line_count += fragment.count("\n")
+        except BaseException:
+            output_stream.close()
+            tmp_output_path.unlink(missing_ok=True)
+            raise
+
+    try:
+        os.replace(tmp_output_path, output_file_path)
         print(f"\nSuccessfully built: {output_file_path}")
-        print(f"Total lines in output: {len(''.join(final_lua_code).splitlines())}")
-    except Exception as e:
+        print(f"Total lines in output: {line_count}")
+    except OSError as e:
+        tmp_output_path.unlink(missing_ok=True)
         print(f"Error writing output file {output_file_path}: {e}")
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """Command-line entry point. `argv` defaults to sys.argv[1:]."""
     parser = argparse.ArgumentParser(
         description="Builds a single Lua file from a modular project for DCS, with specific file ordering.",
         formatter_class=argparse.RawTextHelpFormatter,  # For better help text display
@@ -666,8 +1138,26 @@ if __name__ == "__main__":
         default="global",
         help="Scope for the generated script. 'global' (default) generates normal global scope, 'local' wraps content in do...end blocks for local scoping.",
     )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        default=None,
+        help="Optional: Directory for caching per-module scan and sanitization results between builds.",
+    )
+    parser.add_argument(
+        "--use-luaparser",
+        dest="use_luaparser",
+        action="store_true",
+        help="Use luaparser (slower) instead of the built-in tokenizer for require, goto and strict DCS checks.",
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    # LOGLEVEL=DEBUG shows diagnostics such as dependency cache hits
+    log_level = os.environ.get("LOGLEVEL", "WARNING").upper()
+    logging.basicConfig(
+        level=log_level if isinstance(logging.getLevelName(log_level), int) else "WARNING", format="%(message)s"
+    )
 
     # Parse dependencies if provided as command line argument
     dependencies_config = None
@@ -688,4 +1178,10 @@ if __name__ == "__main__":
         args.dcs_strict_sanitize,
         dependencies_config,
         args.scope,
+        args.use_luaparser,
+        args.cache_dir,
     )
+
+
+if __name__ == "__main__":
+    main()
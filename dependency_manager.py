@@ -5,16 +5,54 @@ Dependency manager for fetching and processing external Lua dependencies.
 
 import hashlib
 import json
+import logging
+import os
 import re
 import tempfile
+import threading
+import urllib.error
 import urllib.parse
 import urllib.request
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# Routine cache hits are only reported at debug level, to keep CI logs to what was actually downloaded
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent downloads in fetch_all
+MAX_FETCH_WORKERS = 8
+
+# GitHub release sources: owner/repo@tag
+GITHUB_RELEASE_SOURCE_PATTERN = re.compile(r"^([^/]+)/([^@]+)@(.+)$")
+
+# Default size budget of the download cache; least recently used files are removed beyond it
+DEFAULT_MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# Cache file recording the ETag/Last-Modified validators of downloaded files, keyed by cache file name
+CACHE_INDEX_NAME = "index.json"
+
+
+def _response_validators(response) -> dict[str, str]:
+    """Return the ETag and Last-Modified headers of a response, if it sent any."""
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return {}
+    validators = {}
+    for key, header in (("etag", "ETag"), ("last_modified", "Last-Modified")):
+        value = headers.get(header)
+        if isinstance(value, str) and value:
+            validators[key] = value
+    return validators
+
 
 class Dependency:
     """Represents a single external dependency."""
 
+    __slots__ = ("name", "type", "source", "file", "license", "description")
+
+    TYPES = frozenset(("github_release", "url", "local"))
+
     def __init__(self, config: dict):
         self.name = config.get("name", "")
         self.type = config.get("type", "")  # "github_release", "url", "local"
@@ -28,7 +66,7 @@ class Dependency:
             raise ValueError("Dependency must have a 'name' field")
         if not self.type:
             raise ValueError(f"Dependency '{self.name}' must have a 'type' field")
-        if self.type not in ["github_release", "url", "local"]:
+        if self.type not in self.TYPES:
             raise ValueError(f"Dependency '{self.name}' has invalid type: {self.type}")
         if not self.source:
             raise ValueError(f"Dependency '{self.name}' must have a 'source' field")
@@ -41,9 +79,48 @@ class Dependency:
 class DependencyManager:
     """Manages fetching and processing of external dependencies."""
 
-    def __init__(self, cache_dir: Path | None = None):
+    def __init__(self, cache_dir: Path | None = None, max_cache_bytes: int = DEFAULT_MAX_CACHE_BYTES):
         self.cache_dir = cache_dir or Path(tempfile.gettempdir()) / "dcs-lua-composer-cache"
+        self.max_cache_bytes = max_cache_bytes
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._print_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._index: dict | None = None
+        # Content fetched during this manager's lifetime, by URL; bounded by the number of configured dependencies
+        self._memory_cache: dict[str, str] = {}
+        self._memory_cache_lock = threading.Lock()
+        self._resolved_bases: dict[Path, Path] = {}
+
+    def _log(self, message: str) -> None:
+        """Print a progress message; fetches may run concurrently, so lines are printed whole."""
+        with self._print_lock:
+            print(message)
+
+    def fetch_all(self, deps: list[Dependency], base_path: Path) -> Iterator[tuple[str, str | None]]:
+        """
+        Fetch several dependencies concurrently.
+
+        Args:
+            deps: The dependencies to fetch
+            base_path: Base path for resolving local dependencies
+
+        Yields:
+            (lua_content, license_content) for each dependency, in the order given. A failed fetch raises
+            its exception when its result is reached.
+        """
+        if len(deps) < 2:
+            for dep in deps:
+                yield self.fetch_dependency(dep, base_path)
+            return
+        with ThreadPoolExecutor(max_workers=min(MAX_FETCH_WORKERS, len(deps))) as executor:
+            futures = [executor.submit(self.fetch_dependency, dep, base_path) for dep in deps]
+            try:
+                for future in futures:
+                    yield future.result()
+            finally:
+                # Don't start fetches nobody will consume once one has failed
+                for future in futures:
+                    future.cancel()
 
     def fetch_dependency(self, dep: Dependency, base_path: Path) -> tuple[str, str | None]:
         """
@@ -69,7 +146,7 @@ class DependencyManager:
         """Fetch a file from a GitHub release."""
         # Parse the source to extract owner, repo, and tag
         # Expected format: owner/repo@tag or owner/repo@latest
-        match = re.match(r"^([^/]+)/([^@]+)@(.+)$", dep.source)
+        match = GITHUB_RELEASE_SOURCE_PATTERN.match(dep.source)
         if not match:
             raise ValueError(
                 f"Invalid GitHub release source format for '{dep.name}': {dep.source}. Expected format: owner/repo@tag"
@@ -82,8 +159,8 @@ class DependencyManager:
             # Get the latest release tag
             api_url = f"https://api.github.com/repos/{owner}/{repo}/releases/latest"
             try:
-                with urllib.request.urlopen(api_url) as response:
-                    release_data = json.loads(response.read().decode())
+                with self._open(api_url) as response:
+                    release_data = json.load(response)
                     tag = release_data["tag_name"]
             except Exception as e:
                 raise RuntimeError(f"Failed to fetch latest release for {owner}/{repo}: {e}")
@@ -101,22 +178,23 @@ class DependencyManager:
             try:
                 license_content = self._download_with_cache(license_url, f"{dep.name}_{tag}_{dep.license}")
             except Exception as e:
-                print(f"Warning: Failed to fetch license for '{dep.name}': {e}")
+                self._log(f"Warning: Failed to fetch license for '{dep.name}': {e}")
 
         return lua_content, license_content
 
     def _fetch_url(self, dep: Dependency) -> tuple[str, str | None]:
         """Fetch a file from a URL."""
         # Fetch the Lua file
-        lua_content = self._download_with_cache(dep.source, f"{dep.name}_main")
+        # Plain URLs may change in place, so cached copies are revalidated with the server
+        lua_content = self._download_with_cache(dep.source, f"{dep.name}_main", revalidate=True)
 
         # Fetch license if specified
         license_content = None
         if dep.license:
             try:
-                license_content = self._download_with_cache(dep.license, f"{dep.name}_license")
+                license_content = self._download_with_cache(dep.license, f"{dep.name}_license", revalidate=True)
             except Exception as e:
-                print(f"Warning: Failed to fetch license for '{dep.name}': {e}")
+                self._log(f"Warning: Failed to fetch license for '{dep.name}': {e}")
 
         return lua_content, license_content
 
@@ -126,9 +204,13 @@ class DependencyManager:
         file_path = (base_path / dep.source).resolve()
 
         # Security check: ensure the resolved path is within allowed boundaries
-        # Resolve base_path too to handle symlinks correctly
+        # Resolve base_path too to handle symlinks correctly; local dependencies usually share it, so it is
+        # resolved once per manager
+        resolved_base = self._resolved_bases.get(base_path)
+        if resolved_base is None:
+            resolved_base = self._resolved_bases[base_path] = base_path.resolve()
         try:
-            file_path.relative_to(base_path.resolve())
+            file_path.relative_to(resolved_base)
         except ValueError:
             raise ValueError(f"Local dependency '{dep.name}' resolves to a path outside the project: {file_path}")
 
@@ -136,51 +218,186 @@ class DependencyManager:
             raise FileNotFoundError(f"Local dependency '{dep.name}' not found at: {file_path}")
 
         # Read the Lua file
-        with open(file_path, encoding="utf-8") as f:
-            lua_content = f.read()
+        lua_content = file_path.read_text(encoding="utf-8")
 
         # Read license if specified
         license_content = None
         if dep.license:
             license_path = (base_path / dep.license).resolve()
             try:
-                license_path.relative_to(base_path.resolve())
+                license_path.relative_to(resolved_base)
                 if license_path.exists():
-                    with open(license_path, encoding="utf-8") as f:
-                        license_content = f.read()
+                    license_content = license_path.read_text(encoding="utf-8")
                 else:
-                    print(f"Warning: License file not found for '{dep.name}': {license_path}")
+                    self._log(f"Warning: License file not found for '{dep.name}': {license_path}")
             except ValueError:
-                print(f"Warning: License path for '{dep.name}' is outside project boundaries")
+                self._log(f"Warning: License path for '{dep.name}' is outside project boundaries")
 
         return lua_content, license_content
 
-    def _download_with_cache(self, url: str, cache_key: str) -> str:
-        """Download a file with caching support."""
+    def _open(self, url: str | urllib.request.Request):
+        """Open a URL for reading. All network access goes through here."""
+        return urllib.request.urlopen(url)
+
+    def _cached_validators(self, cache_file: Path) -> dict[str, str]:
+        """Return the validators recorded for a cache file (empty if none are known)."""
+        with self._index_lock:
+            if self._index is None:
+                try:
+                    with open(self.cache_dir / CACHE_INDEX_NAME, encoding="utf-8") as f:
+                        index = json.load(f)
+                except (OSError, ValueError):
+                    index = {}
+                self._index = index if isinstance(index, dict) else {}
+            validators = self._index.get(cache_file.name)
+            return dict(validators) if isinstance(validators, dict) else {}
+
+    def _store_validators(self, cache_file: Path, validators: dict[str, str]) -> None:
+        """Record (or forget) the validators of a cache file. The index is replaced atomically."""
+        self._cached_validators(cache_file)  # Make sure the index is loaded
+        with self._index_lock:
+            if validators:
+                self._index[cache_file.name] = validators
+            elif self._index.pop(cache_file.name, None) is None:
+                return
+            tmp_file = self.cache_dir / f"{CACHE_INDEX_NAME}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(self._index, f)
+                os.replace(tmp_file, self.cache_dir / CACHE_INDEX_NAME)
+            except OSError as e:
+                self._log(f"Warning: Failed to update download cache index: {e}")
+
+    def _download_with_cache(self, url: str, cache_key: str, revalidate: bool = False) -> str:
+        """
+        Download a file with caching support.
+
+        A URL is fetched at most once per manager; later calls return the content already in memory.
+        With `revalidate`, a cached copy whose ETag or Last-Modified is known is checked with a conditional
+        request and only downloaded again if the server reports a change.
+        """
+        with self._memory_cache_lock:
+            content = self._memory_cache.get(url)
+        if content is None:
+            content = self._load_or_download(url, cache_key, revalidate)
+            with self._memory_cache_lock:
+                self._memory_cache[url] = content
+        return content
+
+    def _load_or_download(self, url: str, cache_key: str, revalidate: bool) -> str:
+        """Return a URL's content from the download cache, downloading it if needed."""
         # Create a hash of the URL for the cache filename
-        url_hash = hashlib.sha256(url.encode()).hexdigest()[:16]
+        url_hash = hashlib.blake2b(url.encode("utf-8"), digest_size=8).hexdigest()
         cache_file = self.cache_dir / f"{cache_key}_{url_hash}.cached"
 
         # Check if cached version exists
         if cache_file.exists():
-            print(f"Using cached version of {url}")
+            validators = self._cached_validators(cache_file) if revalidate else {}
+            if validators:
+                return self._revalidate(url, cache_file, validators)
+            logger.debug("Using cached version of %s", url)
+            self._touch(cache_file)
             with open(cache_file, encoding="utf-8") as f:
                 return f.read()
 
         # Download the file
-        print(f"Downloading {url}")
+        self._log(f"Downloading {url}")
         try:
-            with urllib.request.urlopen(url) as response:
-                content = response.read().decode("utf-8")
+            with self._open(url) as response:
+                data = response.read()
+                validators = _response_validators(response)
+            content = data.decode("utf-8")
 
             # Save to cache
-            with open(cache_file, "w", encoding="utf-8") as f:
-                f.write(content)
+            self._write_cache_file(cache_file, data)
+            self._store_validators(cache_file, validators)
+            self._evict_lru(self.max_cache_bytes, keep=cache_file)
 
             return content
         except Exception as e:
             raise RuntimeError(f"Failed to download {url}: {e}")
 
+    def _revalidate(self, url: str, cache_file: Path, validators: dict[str, str]) -> str:
+        """Return a cached file's content, downloading it again only if it changed on the server."""
+        headers = {}
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        try:
+            with self._open(urllib.request.Request(url, headers=headers)) as response:
+                data = response.read()
+                new_validators = _response_validators(response)
+            content = data.decode("utf-8")
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                logger.debug("Using cached version of %s (not modified)", url)
+            else:
+                self._log(f"Warning: Could not revalidate {url} (HTTP {e.code}), using cached version")
+        except Exception as e:
+            self._log(f"Warning: Could not revalidate {url} ({e}), using cached version")
+        else:
+            self._log(f"Downloaded updated {url}")
+            self._write_cache_file(cache_file, data)
+            self._store_validators(cache_file, new_validators)
+            self._evict_lru(self.max_cache_bytes, keep=cache_file)
+            return content
+
+        self._touch(cache_file)
+        with open(cache_file, encoding="utf-8") as f:
+            return f.read()
+
+    @staticmethod
+    def _write_cache_file(cache_file: Path, data: bytes) -> None:
+        """Write a downloaded body to the cache as received. Readers never see a partially written file."""
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+            os.replace(tmp_file, cache_file)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def _touch(cache_file: Path) -> None:
+        """Mark a cache file as just used. Recency is tracked by mtime, as atime is often not updated."""
+        try:
+            os.utime(cache_file)
+        except OSError:
+            pass
+
+    def _evict_lru(self, target_bytes: int, keep: Path | None = None) -> None:
+        """Remove least recently used cache files until the cache is within `target_bytes`."""
+        entries = []
+        total_bytes = 0
+        for cache_file in self.cache_dir.glob("*.cached"):
+            try:
+                st = cache_file.stat()
+            except OSError:
+                continue  # Removed concurrently
+            entries.append((st.st_mtime_ns, st.st_size, cache_file))
+            total_bytes += st.st_size
+        if total_bytes <= target_bytes:
+            return
+
+        entries.sort(key=lambda entry: entry[0])
+        for _, size, cache_file in entries:
+            if total_bytes <= target_bytes:
+                break
+            if cache_file == keep:
+                continue
+            try:
+                cache_file.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self._log(f"Warning: Failed to evict {cache_file.name} from the download cache: {e}")
+                continue
+            total_bytes -= size
+            self._store_validators(cache_file, {})
+
     def format_dependency_block(self, dep: Dependency, lua_content: str, license_content: str | None) -> str:
         """Format a dependency with its license for injection into the composed file."""
         lines = []
@@ -196,8 +413,7 @@ class DependencyManager:
         # Add license if available
         if license_content:
             lines.append("-- License:")
-            for line in license_content.strip().split("\n"):
-                lines.append(f"-- {line}" if line else "--")
+            lines.extend(f"-- {line}" if line else "--" for line in license_content.strip().split("\n"))
 
         lines.append("")  # Empty line before content
 
@@ -8,6 +8,21 @@ import os
 import sys
 from pathlib import Path
 
+# Keys accepted in .composerrc
+VALID_KEYS = frozenset(
+    {
+        "source_directory",
+        "output_file",
+        "header_file",
+        "namespace_file",
+        "entrypoint_file",
+        "footer_file",
+        "dcs_strict_sanitize",
+        "scope",
+        "dependencies",
+    }
+)
+
 
 def read_composerrc(workspace_path):
     """
@@ -22,8 +37,8 @@ def read_composerrc(workspace_path):
         return {}
 
     try:
-        with open(composerrc_path) as f:
-            config = json.load(f)
+        # Parsed from bytes so JSON's own UTF-8/16/32 detection applies rather than the locale encoding
+        config = json.loads(composerrc_path.read_bytes())
         return config
     except json.JSONDecodeError as e:
         print(f"::error::Invalid JSON in .composerrc: {e}", file=sys.stderr)
@@ -43,23 +58,16 @@ def validate_config(config):
     Returns:
         dict: Validated configuration
     """
-    valid_keys = {
-        "source_directory",
-        "output_file",
-        "header_file",
-        "namespace_file",
-        "entrypoint_file",
-        "footer_file",
-        "dcs_strict_sanitize",
-        "scope",
-        "dependencies",
-    }
-
-    # Filter out any invalid keys
-    validated = {k: v for k, v in config.items() if k in valid_keys}
+    # Filter out any invalid keys, in a single pass
+    validated = {}
+    invalid_keys = []
+    for k, v in config.items():
+        if k in VALID_KEYS:
+            validated[k] = v
+        else:
+            invalid_keys.append(k)
 
     # Warn about invalid keys
-    invalid_keys = set(config.keys()) - valid_keys
     if invalid_keys:
         print(f"::warning::Unknown keys in .composerrc will be ignored: {', '.join(invalid_keys)}")
 
@@ -75,6 +83,7 @@ def output_for_github_actions(config):
     """
     # Output each config value as an environment variable
     # GitHub Actions will pick these up and use them
+    lines = []
     for key, value in config.items():
         # Special handling for dependencies (output as JSON)
         if key == "dependencies" and isinstance(value, list):
@@ -82,15 +91,17 @@ def output_for_github_actions(config):
         # Convert boolean values to string
         elif isinstance(value, bool):
             value = "true" if value else "false"
-
-        # Output in GitHub Actions format
-        # Using GITHUB_OUTPUT for newer actions
-        output_file = os.getenv("GITHUB_OUTPUT", "")
-        if output_file:
-            with open(output_file, "a") as f:
-                f.write(f"rc_{key}={value}\n")
-        else:
-            # Fallback for older GitHub Actions
+        lines.append((key, value))
+
+    # Output in GitHub Actions format
+    # Using GITHUB_OUTPUT for newer actions
+    output_file = os.getenv("GITHUB_OUTPUT", "")
+    if output_file:
+        with open(output_file, "a") as f:
+            f.write("".join(f"rc_{key}={value}\n" for key, value in lines))
+    else:
+        # Fallback for older GitHub Actions
+        for key, value in lines:
             print(f"::set-output name=rc_{key}::{value}")
 
 
@@ -1,11 +1,13 @@
 -- Main entry point
-function TestMission.start()
+function MyMission.init()
+    print("Mission initialized: " .. MyMission.name)
+
     -- Use the test library
-    local message = TestLib.greet("DCS World")
-    env.info(message)
+    local greeting = TestLib.greet("DCS World")
+    print(greeting)
 
-    local result = TestLib.add(42, 58)
-    env.info("The answer is: " .. result)
+    local sum = TestLib.add(2, 3)
+    log.info("Sum from TestLib: " .. sum)
 end
 
-TestMission.start()
+MyMission.init()
@@ -1,5 +1,5 @@
--- Test Mission Namespace
-TestMission = {
-    name = "Test Mission with Dependencies",
+-- My Mission Namespace
+MyMission = {
+    name = "Dependency Test Mission",
     version = "1.0.0"
 }
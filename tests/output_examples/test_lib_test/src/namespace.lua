@@ -0,0 +1,5 @@
+-- Test Mission Namespace
+TestMission = {
+    name = "Test Mission with Dependencies",
+    version = "1.0.0"
+}
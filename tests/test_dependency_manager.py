@@ -3,11 +3,14 @@
 Tests for the dependency manager functionality.
 """
 
+import io
 import json
+import os
 import sys
-import tempfile
+import urllib.error
+import urllib.request
 from pathlib import Path
-from unittest.mock import Mock, patch
+from unittest.mock import patch
 
 import pytest
 
@@ -17,125 +20,104 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from dependency_manager import Dependency, DependencyManager, load_dependencies_config
 
 
-class TestDependency:
-    """Test the Dependency class."""
+def fake_response(body: bytes, headers: dict | None = None) -> io.BytesIO:
+    """Build a one-shot urlopen() response: a BytesIO is already a readable context manager."""
+    response = io.BytesIO(body)
+    response.headers = headers or {}
+    return response
 
-    def test_valid_github_release_dependency(self):
-        """Test creating a valid GitHub release dependency."""
-        config = {
-            "name": "test-lib",
-            "type": "github_release",
-            "source": "owner/repo@v1.0.0",
-            "file": "test-lib.lua",
-            "license": "LICENSE",
-            "description": "Test library",
-        }
-        dep = Dependency(config)
-        assert dep.name == "test-lib"
-        assert dep.type == "github_release"
-        assert dep.source == "owner/repo@v1.0.0"
-        assert dep.file == "test-lib.lua"
-        assert dep.license == "LICENSE"
-        assert dep.description == "Test library"
-
-    def test_valid_url_dependency(self):
-        """Test creating a valid URL dependency."""
-        config = {
-            "name": "remote-lib",
-            "type": "url",
-            "source": "https://example.com/lib.lua",
-            "license": "https://example.com/LICENSE",
-        }
-        dep = Dependency(config)
-        assert dep.name == "remote-lib"
-        assert dep.type == "url"
-        assert dep.source == "https://example.com/lib.lua"
-        assert dep.license == "https://example.com/LICENSE"
-
-    def test_valid_local_dependency(self):
-        """Test creating a valid local dependency."""
-        config = {
-            "name": "local-lib",
-            "type": "local",
-            "source": "libs/local-lib.lua",
-            "license": "libs/LICENSE",
-        }
-        dep = Dependency(config)
-        assert dep.name == "local-lib"
-        assert dep.type == "local"
-        assert dep.source == "libs/local-lib.lua"
-
-    def test_missing_name(self):
-        """Test that missing name raises ValueError."""
-        config = {"type": "url", "source": "https://example.com/lib.lua"}
-        with pytest.raises(ValueError, match="must have a 'name' field"):
-            Dependency(config)
 
-    def test_missing_type(self):
-        """Test that missing type raises ValueError."""
-        config = {"name": "test", "source": "https://example.com/lib.lua"}
-        with pytest.raises(ValueError, match="must have a 'type' field"):
-            Dependency(config)
+# Canned bodies for the URLs the download tests hit, served by _fake_urlopen.
+URL_FIXTURES: dict[str, bytes] = {
+    "https://api.github.com/repos/owner/repo/releases/latest": json.dumps({"tag_name": "v1.2.3"}).encode(),
+    "https://github.com/owner/repo/releases/download/v1.2.3/lib.lua": b"-- Test Lua content\nprint('Hello')",
+    "https://example.com/lib.lua": b"-- URL Lua content",
+}
 
-    def test_invalid_type(self):
-        """Test that invalid type raises ValueError."""
-        config = {"name": "test", "type": "invalid", "source": "test.lua"}
-        with pytest.raises(ValueError, match="invalid type"):
-            Dependency(config)
 
-    def test_missing_source(self):
-        """Test that missing source raises ValueError."""
-        config = {"name": "test", "type": "url"}
-        with pytest.raises(ValueError, match="must have a 'source' field"):
-            Dependency(config)
+def _fake_urlopen(url):
+    """Stand-in for urllib.request.urlopen() that answers from URL_FIXTURES."""
+    if isinstance(url, urllib.request.Request):
+        url = url.full_url
+    return fake_response(URL_FIXTURES[url])
+
+
+def _url_dep(name, source=None):
+    """Build a url-type dependency config entry, served from example.com by default."""
+    return {"name": name, "type": "url", "source": source or f"https://example.com/{name}.lua"}
+
+
+def _local_dep(name, source):
+    """Build a local-type dependency config entry."""
+    return {"name": name, "type": "local", "source": source}
+
+
+class TestDependency:
+    """Test the Dependency class."""
 
-    def test_github_release_missing_file(self):
-        """Test that GitHub release without file raises ValueError."""
-        config = {
-            "name": "test",
-            "type": "github_release",
-            "source": "owner/repo@v1.0.0",
-        }
-        with pytest.raises(ValueError, match="must specify a 'file' field"):
+    @pytest.mark.parametrize(
+        "config",
+        [
+            {
+                "name": "test-lib",
+                "type": "github_release",
+                "source": "owner/repo@v1.0.0",
+                "file": "test-lib.lua",
+                "license": "LICENSE",
+                "description": "Test library",
+            },
+            {
+                "name": "remote-lib",
+                "type": "url",
+                "source": "https://example.com/lib.lua",
+                "license": "https://example.com/LICENSE",
+            },
+            {
+                "name": "local-lib",
+                "type": "local",
+                "source": "libs/local-lib.lua",
+                "license": "libs/LICENSE",
+            },
+        ],
+        ids=["github_release", "url", "local"],
+    )
+    def test_valid_dependency(self, config):
+        """Test creating a valid dependency of each type."""
+        dep = Dependency(config)
+        for field, value in config.items():
+            assert getattr(dep, field) == value
+
+    @pytest.mark.parametrize(
+        "config,match",
+        [
+            ({"type": "url", "source": "https://example.com/lib.lua"}, "must have a 'name' field"),
+            ({"name": "test", "source": "https://example.com/lib.lua"}, "must have a 'type' field"),
+            ({"name": "test", "type": "invalid", "source": "test.lua"}, "invalid type"),
+            ({"name": "test", "type": "url"}, "must have a 'source' field"),
+            ({"name": "test", "type": "github_release", "source": "owner/repo@v1.0.0"}, "must specify a 'file' field"),
+        ],
+        ids=["missing_name", "missing_type", "invalid_type", "missing_source", "github_release_missing_file"],
+    )
+    def test_invalid_dependency(self, config, match):
+        """Test that invalid configurations raise ValueError."""
+        with pytest.raises(ValueError, match=match):
             Dependency(config)
 
 
 class TestDependencyManager:
     """Test the DependencyManager class."""
 
-    def test_cache_directory_creation(self):
+    def test_cache_directory_creation(self, tmp_path):
         """Test that cache directory is created."""
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            cache_dir = Path(tmp_dir) / "test-cache"
-            DependencyManager(cache_dir)
-            assert cache_dir.exists()
-            assert cache_dir.is_dir()
+        cache_dir = tmp_path / "test-cache"
+        DependencyManager(cache_dir)
+        assert cache_dir.exists()
+        assert cache_dir.is_dir()
 
-    @patch("urllib.request.urlopen")
-    def test_fetch_github_release(self, mock_urlopen):
+    @patch("urllib.request.urlopen", side_effect=_fake_urlopen)
+    def test_fetch_github_release(self, mock_urlopen, tmp_path):
         """Test fetching from GitHub release."""
-        # Mock the API response for latest release
-        api_response = Mock()
-        api_response.__enter__ = Mock(return_value=api_response)
-        api_response.__exit__ = Mock(return_value=None)
-        api_response.read.return_value = json.dumps({"tag_name": "v1.2.3"}).encode()
-
-        # Mock the file download response
-        file_response = Mock()
-        file_response.__enter__ = Mock(return_value=file_response)
-        file_response.__exit__ = Mock(return_value=None)
-        file_response.read.return_value = b"-- Test Lua content\nprint('Hello')"
-
-        # Configure urlopen to return different responses based on URL
-        def urlopen_side_effect(url):
-            if "api.github.com" in url:
-                return api_response
-            else:
-                return file_response
-
-        mock_urlopen.side_effect = urlopen_side_effect
-
-        manager = DependencyManager()
+        manager = DependencyManager(tmp_path / "cache")
         dep = Dependency(
             {
                 "name": "test-lib",
@@ -149,16 +131,10 @@ class TestDependencyManager:
         assert content == "-- Test Lua content\nprint('Hello')"
         assert license_content is None
 
-    @patch("urllib.request.urlopen")
-    def test_fetch_url(self, mock_urlopen):
+    @patch("urllib.request.urlopen", side_effect=_fake_urlopen)
+    def test_fetch_url(self, mock_urlopen, tmp_path):
         """Test fetching from URL."""
-        response = Mock()
-        response.__enter__ = Mock(return_value=response)
-        response.__exit__ = Mock(return_value=None)
-        response.read.return_value = b"-- URL Lua content"
-        mock_urlopen.return_value = response
-
-        manager = DependencyManager()
+        manager = DependencyManager(tmp_path / "cache")
         dep = Dependency(
             {
                 "name": "url-lib",
@@ -171,68 +147,94 @@ class TestDependencyManager:
         assert content == "-- URL Lua content"
         assert license_content is None
 
-    def test_fetch_local(self):
+    def test_fetch_local(self, tmp_path):
         """Test fetching from local file."""
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            base_path = Path(tmp_dir)
-            lua_file = base_path / "libs" / "local.lua"
-            lua_file.parent.mkdir(parents=True)
-            lua_file.write_text("-- Local Lua content")
-
-            manager = DependencyManager()
-            dep = Dependency(
-                {
-                    "name": "local-lib",
-                    "type": "local",
-                    "source": "libs/local.lua",
-                }
-            )
-
-            content, license_content = manager.fetch_dependency(dep, base_path)
-            assert content == "-- Local Lua content"
-            assert license_content is None
-
-    def test_fetch_local_with_license(self):
+        base_path = tmp_path
+        lua_file = base_path / "libs" / "local.lua"
+        lua_file.parent.mkdir(parents=True)
+        lua_file.write_text("-- Local Lua content")
+
+        manager = DependencyManager()
+        dep = Dependency(
+            {
+                "name": "local-lib",
+                "type": "local",
+                "source": "libs/local.lua",
+            }
+        )
+
+        content, license_content = manager.fetch_dependency(dep, base_path)
+        assert content == "-- Local Lua content"
+        assert license_content is None
+
+    def test_fetch_local_with_license(self, tmp_path):
         """Test fetching local file with license."""
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            base_path = Path(tmp_dir)
-            lua_file = base_path / "libs" / "local.lua"
-            license_file = base_path / "libs" / "LICENSE"
-            lua_file.parent.mkdir(parents=True)
-            lua_file.write_text("-- Local Lua content")
-            license_file.write_text("MIT License")
-
-            manager = DependencyManager()
-            dep = Dependency(
-                {
-                    "name": "local-lib",
-                    "type": "local",
-                    "source": "libs/local.lua",
-                    "license": "libs/LICENSE",
-                }
-            )
-
-            content, license_content = manager.fetch_dependency(dep, base_path)
-            assert content == "-- Local Lua content"
-            assert license_content == "MIT License"
-
-    def test_fetch_local_outside_base_path(self):
+        base_path = tmp_path
+        lua_file = base_path / "libs" / "local.lua"
+        license_file = base_path / "libs" / "LICENSE"
+        lua_file.parent.mkdir(parents=True)
+        lua_file.write_text("-- Local Lua content")
+        license_file.write_text("MIT License")
+
+        manager = DependencyManager()
+        dep = Dependency(
+            {
+                "name": "local-lib",
+                "type": "local",
+                "source": "libs/local.lua",
+                "license": "libs/LICENSE",
+            }
+        )
+
+        content, license_content = manager.fetch_dependency(dep, base_path)
+        assert content == "-- Local Lua content"
+        assert license_content == "MIT License"
+
+    def test_fetch_all_preserves_order(self, tmp_path):
+        """Test that concurrently fetched dependencies come back in configuration order."""
+        base_path = tmp_path
+        names = [f"lib{i}" for i in range(5)]
+        for name in names:
+            (base_path / f"{name}.lua").write_text(f"-- {name}")
+
+        manager = DependencyManager(base_path / "cache")
+        deps = [Dependency({"name": name, "type": "local", "source": f"{name}.lua"}) for name in names]
+
+        results = list(manager.fetch_all(deps, base_path))
+        assert results == [(f"-- {name}", None) for name in names]
+
+    def test_fetch_all_raises_failed_fetch_in_order(self, tmp_path):
+        """Test that a failed fetch raises when its result is reached."""
+        base_path = tmp_path
+        (base_path / "good.lua").write_text("-- good")
+
+        manager = DependencyManager(base_path / "cache")
+        deps = [
+            Dependency({"name": "good", "type": "local", "source": "good.lua"}),
+            Dependency({"name": "missing", "type": "local", "source": "missing.lua"}),
+        ]
+
+        fetched = manager.fetch_all(deps, base_path)
+        assert next(fetched) == ("-- good", None)
+        with pytest.raises(FileNotFoundError, match="missing"):
+            next(fetched)
+
+    def test_fetch_local_outside_base_path(self, tmp_path):
         """Test that fetching files outside base path raises error."""
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            base_path = Path(tmp_dir) / "project"
-            base_path.mkdir()
-
-            manager = DependencyManager()
-            dep = Dependency(
-                {
-                    "name": "bad-lib",
-                    "type": "local",
-                    "source": "../../../etc/passwd",
-                }
-            )
-
-            with pytest.raises(ValueError, match="outside the project"):
-                manager.fetch_dependency(dep, base_path)
+        base_path = tmp_path / "project"
+        base_path.mkdir()
+
+        manager = DependencyManager()
+        dep = Dependency(
+            {
+                "name": "bad-lib",
+                "type": "local",
+                "source": "../../../etc/passwd",
+            }
+        )
+
+        with pytest.raises(ValueError, match="outside the project"):
+            manager.fetch_dependency(dep, base_path)
 
     def test_format_dependency_block(self):
         """Test formatting dependency block."""
@@ -260,28 +262,64 @@ class TestDependencyManager:
         assert "-- Test content" in block
         assert "function test() end" in block
 
-    @patch("urllib.request.urlopen")
-    def test_caching(self, mock_urlopen):
+    @patch("urllib.request.urlopen", side_effect=_fake_urlopen)
+    def test_caching(self, mock_urlopen, tmp_path):
         """Test that downloads are cached."""
-        response = Mock()
-        response.__enter__ = Mock(return_value=response)
-        response.__exit__ = Mock(return_value=None)
-        response.read.return_value = b"-- Cached content"
-        mock_urlopen.return_value = response
+        cache_dir = tmp_path / "cache"
+        manager = DependencyManager(cache_dir)
 
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            cache_dir = Path(tmp_dir) / "cache"
-            manager = DependencyManager(cache_dir)
+        # First fetch
+        content1 = manager._download_with_cache("https://example.com/lib.lua", "test_lib")
+        assert content1 == "-- URL Lua content"
+        assert mock_urlopen.call_count == 1
 
-            # First fetch
-            content1 = manager._download_with_cache("https://example.com/lib.lua", "test_lib")
-            assert content1 == "-- Cached content"
-            assert mock_urlopen.call_count == 1
+        # Second fetch should use cache
+        content2 = manager._download_with_cache("https://example.com/lib.lua", "test_lib")
+        assert content2 == "-- URL Lua content"
+        assert mock_urlopen.call_count == 1  # Should not increase
 
-            # Second fetch should use cache
-            content2 = manager._download_with_cache("https://example.com/lib.lua", "test_lib")
-            assert content2 == "-- Cached content"
-            assert mock_urlopen.call_count == 1  # Should not increase
+    @patch("urllib.request.urlopen")
+    def test_revalidation_with_etag(self, mock_urlopen, tmp_path):
+        """Test that revalidated downloads send the stored ETag and reuse the cache on 304."""
+        mock_urlopen.return_value = fake_response(b"-- Version 1", headers={"ETag": '"v1"'})
+
+        cache_dir = tmp_path / "cache"
+        manager = DependencyManager(cache_dir)
+        url = "https://example.com/lib.lua"
+        assert manager._download_with_cache(url, "test_lib", revalidate=True) == "-- Version 1"
+
+        # Unchanged on the server: the conditional request carries the ETag and the cached copy is used
+        mock_urlopen.side_effect = urllib.error.HTTPError(url, 304, "Not Modified", {}, None)
+        assert DependencyManager(cache_dir)._download_with_cache(url, "test_lib", revalidate=True) == "-- Version 1"
+        request = mock_urlopen.call_args[0][0]
+        assert request.get_header("If-none-match") == '"v1"'
+
+        # Changed on the server: the new content replaces the cached copy
+        mock_urlopen.side_effect = None
+        mock_urlopen.return_value = fake_response(b"-- Version 2", headers={"ETag": '"v2"'})
+        assert DependencyManager(cache_dir)._download_with_cache(url, "test_lib", revalidate=True) == "-- Version 2"
+        mock_urlopen.side_effect = OSError("offline")
+        assert DependencyManager(cache_dir)._download_with_cache(url, "test_lib", revalidate=True) == "-- Version 2"
+        assert DependencyManager(cache_dir)._download_with_cache(url, "test_lib") == "-- Version 2"
+
+        # Within one manager a URL is only fetched once
+        assert manager._download_with_cache(url, "other_key", revalidate=True) == "-- Version 1"
+
+    def test_evict_lru(self, tmp_path):
+        """Test that the least recently used cache files are removed first."""
+        cache_dir = tmp_path / "cache"
+        manager = DependencyManager(cache_dir)
+        for i, name in enumerate(["old", "middle", "new"]):
+            cache_file = cache_dir / f"{name}.cached"
+            cache_file.write_text("x" * 100)
+            os.utime(cache_file, (1000 + i, 1000 + i))
+        manager._touch(cache_dir / "old.cached")  # Used most recently, so now the newest
+
+        manager._evict_lru(250)
+        assert sorted(p.name for p in cache_dir.glob("*.cached")) == ["new.cached", "old.cached"]
+
+        manager._evict_lru(0, keep=cache_dir / "old.cached")
+        assert [p.name for p in cache_dir.glob("*.cached")] == ["old.cached"]
 
 
 class TestLoadDependenciesConfig:
@@ -289,20 +327,7 @@ class TestLoadDependenciesConfig:
 
     def test_load_valid_config(self):
         """Test loading valid dependencies configuration."""
-        config = {
-            "dependencies": [
-                {
-                    "name": "lib1",
-                    "type": "url",
-                    "source": "https://example.com/lib1.lua",
-                },
-                {
-                    "name": "lib2",
-                    "type": "local",
-                    "source": "libs/lib2.lua",
-                },
-            ]
-        }
+        config = {"dependencies": [_url_dep("lib1"), _local_dep("lib2", "libs/lib2.lua")]}
 
         deps = load_dependencies_config(config)
         assert len(deps) == 2
@@ -323,19 +348,8 @@ class TestLoadDependenciesConfig:
 
     def test_load_invalid_dependency(self):
         """Test that invalid dependency raises error."""
-        config = {
-            "dependencies": [
-                {
-                    "name": "valid",
-                    "type": "url",
-                    "source": "https://example.com/valid.lua",
-                },
-                {
-                    # Missing required fields
-                    "type": "url",
-                },
-            ]
-        }
+        # The second entry is missing its required name and source
+        config = {"dependencies": [_url_dep("valid"), {"type": "url"}]}
 
         with pytest.raises(ValueError):
             load_dependencies_config(config)
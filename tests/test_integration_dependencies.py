@@ -3,44 +3,99 @@
 Integration tests for the dependency injection functionality.
 """
 
+import contextlib
+import io
 import json
-import subprocess
+import os
+import re
+import shutil
 import sys
 import tempfile
+import traceback
+import types
+import urllib.request
 from pathlib import Path
-from unittest.mock import Mock, patch
+from unittest.mock import patch
 
-import pytest
+# Add parent directory to path to import composer
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import composer
 
 # Get the project root directory
 PROJECT_ROOT = Path(__file__).parent.parent
-sys.path.insert(0, str(PROJECT_ROOT))
 
 
 def run_composer(working_dir, args):
-    """Run the composer script with given arguments."""
-    cmd = [
-        sys.executable,
-        str(PROJECT_ROOT / "composer.py"),
-    ] + args
-
-    result = subprocess.run(
-        cmd,
-        cwd=working_dir,
-        capture_output=True,
-        text=True,
+    """
+    Run the composer's command-line entry point in-process with given arguments.
+
+    Returns a result with the returncode, stdout and stderr a `python composer.py` run would have produced.
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    returncode = 0
+    previous_cwd = os.getcwd()
+    os.chdir(working_dir)
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            composer.main(args)
+    except SystemExit as e:
+        returncode = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        returncode = 1
+        stderr.write(traceback.format_exc())
+    finally:
+        os.chdir(previous_cwd)
+
+    return types.SimpleNamespace(returncode=returncode, stdout=stdout.getvalue(), stderr=stderr.getvalue())
+
+
+def compose_project(test_dir, files, dependencies):
+    """
+    Write a small project under `test_dir` and compose it with the given dependencies.
+
+    Args:
+        test_dir (Path): Directory to build in; it is also the base for local dependency paths
+        files (dict): File contents keyed by path relative to `test_dir`; sources live under src/
+        dependencies (list): Dependency configuration passed to --dependencies
+
+    Returns:
+        str: The composed output
+    """
+    for relative_path, content in files.items():
+        path = test_dir / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    output_file = test_dir / "output.lua"
+    result = run_composer(
+        test_dir,
+        [
+            str(test_dir / "src"),
+            str(output_file),
+            "--namespace",
+            "namespace.lua",
+            "--entrypoint",
+            "main.lua",
+            "--dependencies",
+            json.dumps(dependencies),
+        ],
     )
+    assert result.returncode == 0, f"Build failed: {result.stderr}"
 
-    return result
+    return output_file.read_text()
 
 
 class TestDependencyIntegration:
     """Integration tests for dependency functionality."""
 
-    def test_local_dependency_integration(self):
+    def test_local_dependency_integration(self, tmp_path):
         """Test end-to-end integration with local dependency."""
-        # Use the test fixture directory
-        test_dir = PROJECT_ROOT / "tests" / "fixtures" / "dependency_test"
+        # Build a private copy of the test fixture directory, without any previously built output
+        test_dir = tmp_path / "dependency_test"
+        shutil.copytree(
+            PROJECT_ROOT / "tests" / "fixtures" / "dependency_test", test_dir, ignore=shutil.ignore_patterns("dist")
+        )
 
         # Read the .composerrc to get configuration
         with open(test_dir / ".composerrc") as f:
@@ -86,10 +141,9 @@ class TestDependencyIntegration:
         assert "function TestLib.greet(name)" in content
         assert "function TestLib.add(a, b)" in content
 
-        # Verify namespace comes after dependencies
-        namespace_pos = content.find("MyMission = {")
-        testlib_pos = content.find("TestLib = {}")
-        assert testlib_pos < namespace_pos, "Dependencies should come before namespace"
+        # Verify namespace comes after dependencies, each emitted exactly once
+        sections = re.findall(r"TestLib = \{\}|MyMission = \{", content)
+        assert sections == ["TestLib = {}", "MyMission = {"], "Dependencies should come before namespace"
 
         # Verify main code can use the dependency
         assert "TestLib.greet" in content
@@ -99,182 +153,119 @@ class TestDependencyIntegration:
         assert "env.info(greeting)" in content
         assert 'env.info("Sum from TestLib: " .. sum)' in content
 
-        # Clean up
-        if output_file.exists():
-            output_file.unlink()
-            output_file.parent.rmdir()
-
-    @pytest.mark.skip(reason="URL mocking doesn't work across subprocess boundaries")
     @patch("dependency_manager.urllib.request.urlopen")
-    def test_url_dependency_integration(self, mock_urlopen):
+    def test_url_dependency_integration(self, mock_urlopen, tmp_path, monkeypatch):
         """Test integration with URL-based dependency."""
-        # Create a temporary test environment
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            test_dir = Path(tmp_dir)
-            src_dir = test_dir / "src"
-            src_dir.mkdir()
-
-            # Create minimal test files
-            (src_dir / "namespace.lua").write_text("TestNS = {}")
-            (src_dir / "main.lua").write_text("print('Using UtilLib: ' .. UtilLib.version)")
-
-            # Mock URL responses
-            lib_response = Mock()
-            lib_response.read.return_value = b"UtilLib = { version = '2.0' }\nfunction UtilLib.test() return true end"
-
-            license_response = Mock()
-            license_response.read.return_value = b"Apache License 2.0"
-
-            def urlopen_side_effect(url):
-                if "utils.lua" in url:
-                    return lib_response
-                elif "LICENSE" in url:
-                    return license_response
-                else:
-                    raise Exception(f"Unexpected URL: {url}")
-
-            mock_urlopen.side_effect = urlopen_side_effect
-
-            # Run composer with URL dependency
-            dependencies = [
-                {
-                    "name": "util-lib",
-                    "type": "url",
-                    "source": "https://example.com/utils.lua",
-                    "license": "https://example.com/LICENSE",
-                    "description": "Utility library from URL",
-                }
-            ]
-
-            result = run_composer(
-                test_dir,
-                [
-                    str(src_dir),
-                    str(test_dir / "output.lua"),
-                    "--namespace",
-                    "namespace.lua",
-                    "--entrypoint",
-                    "main.lua",
-                    "--dependencies",
-                    json.dumps(dependencies),
-                ],
-            )
-
-            assert result.returncode == 0, f"Build failed: {result.stderr}"
-
-            # Verify output
-            output_content = (test_dir / "output.lua").read_text()
-            assert "-- External Dependency: util-lib" in output_content
-            assert "-- Source: https://example.com/utils.lua" in output_content
-            assert "-- Apache License 2.0" in output_content
-            assert "UtilLib = { version = '2.0' }" in output_content
-            assert "env.info('Using UtilLib: ' .. UtilLib.version)" in output_content
-
-    def test_multiple_dependencies_order(self):
+        # Keep the dependency download cache, which lives in the system temp directory, private to this test
+        temp_dir = tmp_path / "tmp"
+        temp_dir.mkdir()
+        monkeypatch.setattr(tempfile, "tempdir", str(temp_dir))
+
+        # Minimal test files
+        files = {
+            "src/namespace.lua": "TestNS = {}",
+            "src/main.lua": "print('Using UtilLib: ' .. UtilLib.version)",
+        }
+
+        # Mock URL responses; every request gets a fresh one-shot body, like a real response
+        url_bodies = {
+            "https://example.com/utils.lua": b"UtilLib = { version = '2.0' }\nfunction UtilLib.test() return true end",
+            "https://example.com/LICENSE": b"Apache License 2.0",
+        }
+
+        def urlopen_side_effect(url):
+            if isinstance(url, urllib.request.Request):
+                url = url.full_url
+            if url not in url_bodies:
+                raise Exception(f"Unexpected URL: {url}")
+            response = io.BytesIO(url_bodies[url])
+            response.headers = {}
+            return response
+
+        mock_urlopen.side_effect = urlopen_side_effect
+
+        # Run composer with URL dependency
+        dependencies = [
+            {
+                "name": "util-lib",
+                "type": "url",
+                "source": "https://example.com/utils.lua",
+                "license": "https://example.com/LICENSE",
+                "description": "Utility library from URL",
+            }
+        ]
+
+        # Verify output
+        output_content = compose_project(tmp_path, files, dependencies)
+        assert "-- External Dependency: util-lib" in output_content
+        assert "-- Source: https://example.com/utils.lua" in output_content
+        assert "-- Apache License 2.0" in output_content
+        assert "UtilLib = { version = '2.0' }" in output_content
+        assert "env.info('Using UtilLib: ' .. UtilLib.version)" in output_content
+
+    def test_multiple_dependencies_order(self, tmp_path):
         """Test that multiple dependencies are injected in declaration order."""
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            test_dir = Path(tmp_dir)
-            src_dir = test_dir / "src"
-            deps_dir = test_dir / "deps"
-            src_dir.mkdir()
-            deps_dir.mkdir()
-
-            # Create test dependencies
-            (deps_dir / "lib1.lua").write_text("Lib1 = { name = 'First' }")
-            (deps_dir / "lib2.lua").write_text("Lib2 = { name = 'Second' }")
-            (deps_dir / "lib3.lua").write_text("Lib3 = { name = 'Third' }")
-
-            # Create minimal source files
-            (src_dir / "namespace.lua").write_text("NS = {}")
-            (src_dir / "main.lua").write_text("print(Lib1.name .. Lib2.name .. Lib3.name)")
-
-            # Define dependencies in specific order
-            dependencies = [
-                {"name": "lib1", "type": "local", "source": "deps/lib1.lua"},
-                {"name": "lib2", "type": "local", "source": "deps/lib2.lua"},
-                {"name": "lib3", "type": "local", "source": "deps/lib3.lua"},
-            ]
-
-            result = run_composer(
-                test_dir,
-                [
-                    str(src_dir),
-                    str(test_dir / "output.lua"),
-                    "--namespace",
-                    "namespace.lua",
-                    "--entrypoint",
-                    "main.lua",
-                    "--dependencies",
-                    json.dumps(dependencies),
-                ],
-            )
-
-            assert result.returncode == 0, f"Build failed: {result.stderr}"
-
-            # Check order in output
-            content = (test_dir / "output.lua").read_text()
-            lib1_pos = content.find("Lib1 = { name = 'First' }")
-            lib2_pos = content.find("Lib2 = { name = 'Second' }")
-            lib3_pos = content.find("Lib3 = { name = 'Third' }")
-            ns_pos = content.find("NS = {}")
-
-            # Verify correct order
-            assert lib1_pos < lib2_pos < lib3_pos < ns_pos, (
-                "Dependencies should be in declaration order and before namespace"
-            )
-
-    def test_dependency_sanitization(self):
+        files = {
+            # Test dependencies
+            "deps/lib1.lua": "Lib1 = { name = 'First' }",
+            "deps/lib2.lua": "Lib2 = { name = 'Second' }",
+            "deps/lib3.lua": "Lib3 = { name = 'Third' }",
+            # Minimal source files
+            "src/namespace.lua": "NS = {}",
+            "src/main.lua": "print(Lib1.name .. Lib2.name .. Lib3.name)",
+        }
+
+        # Define dependencies in specific order
+        dependencies = [
+            {"name": "lib1", "type": "local", "source": "deps/lib1.lua"},
+            {"name": "lib2", "type": "local", "source": "deps/lib2.lua"},
+            {"name": "lib3", "type": "local", "source": "deps/lib3.lua"},
+        ]
+
+        content = compose_project(tmp_path, files, dependencies)
+
+        # Check order in output with a single scan, which also catches a section emitted twice
+        sections = re.findall(r"Lib[123] = \{ name = '[^']+' \}|NS = \{\}", content)
+
+        # Verify correct order
+        assert sections == [
+            "Lib1 = { name = 'First' }",
+            "Lib2 = { name = 'Second' }",
+            "Lib3 = { name = 'Third' }",
+            "NS = {}",
+        ], "Dependencies should be in declaration order and before namespace"
+
+    def test_dependency_sanitization(self, tmp_path):
         """Test that dependencies are properly sanitized."""
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            test_dir = Path(tmp_dir)
-            src_dir = test_dir / "src"
-            deps_dir = test_dir / "deps"
-            src_dir.mkdir()
-            deps_dir.mkdir()
-
-            # Create dependency with code that needs sanitization
-            dep_content = """
-            -- Test dependency
-            local TestDep = {}
-
-            function TestDep.init()
-                print("Initializing TestDep")
-                log.info("TestDep ready")
-                log.warning("This is a warning")
-                log.error("This is an error")
-            end
-
-            return TestDep
-            """
-            (deps_dir / "testdep.lua").write_text(dep_content)
-
-            # Create minimal source files
-            (src_dir / "namespace.lua").write_text("NS = {}")
-            (src_dir / "main.lua").write_text("-- Main")
-
-            dependencies = [{"name": "testdep", "type": "local", "source": "deps/testdep.lua"}]
-
-            result = run_composer(
-                test_dir,
-                [
-                    str(src_dir),
-                    str(test_dir / "output.lua"),
-                    "--namespace",
-                    "namespace.lua",
-                    "--entrypoint",
-                    "main.lua",
-                    "--dependencies",
-                    json.dumps(dependencies),
-                ],
-            )
-
-            assert result.returncode == 0, f"Build failed: {result.stderr}"
-
-            # Verify sanitization
-            content = (test_dir / "output.lua").read_text()
-            assert 'env.info("Initializing TestDep")' in content
-            assert 'env.info("TestDep ready")' in content
-            assert 'env.warning("This is a warning")' in content
-            assert 'env.error("This is an error")' in content
-            assert "print(" not in content
-            assert "log.info(" not in content
+        # Dependency with code that needs sanitization
+        dep_content = """
+        -- Test dependency
+        local TestDep = {}
+
+        function TestDep.init()
+            print("Initializing TestDep")
+            log.info("TestDep ready")
+            log.warning("This is a warning")
+            log.error("This is an error")
+        end
+
+        return TestDep
+        """
+        files = {
+            "deps/testdep.lua": dep_content,
+            # Minimal source files
+            "src/namespace.lua": "NS = {}",
+            "src/main.lua": "-- Main",
+        }
+
+        dependencies = [{"name": "testdep", "type": "local", "source": "deps/testdep.lua"}]
+
+        content = compose_project(tmp_path, files, dependencies)
+
+        # Verify sanitization
+        assert 'env.info("Initializing TestDep")' in content
+        assert 'env.info("TestDep ready")' in content
+        assert 'env.warning("This is a warning")' in content
+        assert 'env.error("This is an error")' in content
+        assert "print(" not in content
+        assert "log.info(" not in content
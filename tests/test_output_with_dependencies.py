@@ -1,20 +1,34 @@
 #!/usr/bin/env python3
 """
-Test that generates actual output files to examine the composed result with dependencies.
+Tests that compose example projects with dependencies.
+
+The tests build into pytest's tmp_path; running this file as a script regenerates the checked-in examples in
+tests/output_examples so the composed result can be examined.
 """
 
 import json
-import subprocess
+import os
+import shutil
 import sys
 from pathlib import Path
 
+# Add parent directory to path to import composer
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import composer
+
 # Get the project root directory
 PROJECT_ROOT = Path(__file__).parent.parent
 OUTPUT_DIR = PROJECT_ROOT / "tests" / "output_examples"
 
 
+def _write_text(path, text):
+    """Write a generated source file, ending it with a newline like the checked-in files."""
+    path.write_text(text if text.endswith("\n") else text + "\n")
+
+
 def run_composer_test(test_name, working_dir, src_dir, output_file, dependencies, namespace_content, main_content):
-    """Run a composer test and generate output."""
+    """Run a composer test and generate output; returns the composed content, or None if the build failed."""
     print(f"\n{'=' * 60}")
     print(f"Running test: {test_name}")
     print(f"{'=' * 60}")
@@ -24,13 +38,11 @@ def run_composer_test(test_name, working_dir, src_dir, output_file, dependencies
     src_path.mkdir(parents=True, exist_ok=True)
 
     # Create namespace and main files
-    (src_path / "namespace.lua").write_text(namespace_content)
-    (src_path / "main.lua").write_text(main_content)
+    _write_text(src_path / "namespace.lua", namespace_content)
+    _write_text(src_path / "main.lua", main_content)
 
-    # Run composer
-    cmd = [
-        sys.executable,
-        str(PROJECT_ROOT / "composer.py"),
+    # Run composer in-process; local dependencies resolve against the working directory
+    args = [
         str(src_path),
         str(output_file),
         "--namespace",
@@ -41,22 +53,34 @@ def run_composer_test(test_name, working_dir, src_dir, output_file, dependencies
         json.dumps(dependencies),
     ]
 
-    result = subprocess.run(cmd, cwd=working_dir, capture_output=True, text=True)
-
-    if result.returncode != 0:
-        print(f"ERROR: {result.stderr}")
-        return False
-
+    previous_cwd = os.getcwd()
+    os.chdir(working_dir)
+    try:
+        composer.main(args)
+    except (Exception, SystemExit) as e:
+        print(f"ERROR: {e!r}")
+        return None
+    finally:
+        os.chdir(previous_cwd)
+
+    # Read the output once; the caller checks this same content
+    content = output_file.read_text()
     print(f"✅ Output generated: {output_file}")
     print(f"   File size: {output_file.stat().st_size:,} bytes")
-    print(f"   Lines: {len(output_file.read_text().splitlines()):,}")
-    return True
-
-
-def test_with_test_lib():
-    """Generate output with our small test library."""
-    test_dir = PROJECT_ROOT / "tests" / "fixtures" / "dependency_test"
-    output_file = OUTPUT_DIR / "example_with_test_lib.lua"
+    print(f"   Lines: {len(content.splitlines()):,}")
+    return content
+
+
+def build_test_lib_example(output_dir):
+    """Generate output with our small test library under `output_dir`."""
+    # Build in a directory of our own so the dependency_test fixture sources the other tests assert on stay untouched
+    test_dir = output_dir / "test_lib_test"
+    shutil.copytree(
+        PROJECT_ROOT / "tests" / "fixtures" / "dependency_test" / "external_deps",
+        test_dir / "external_deps",
+        dirs_exist_ok=True,
+    )
+    output_file = output_dir / "example_with_test_lib.lua"
 
     dependencies = [
         {
@@ -91,80 +115,15 @@ TestMission.start()"""
     )
 
 
-def test_with_mist():
-    """Generate output with mock MIST-like dependency."""
-    test_dir = OUTPUT_DIR / "mist_test"
+def build_mist_example(output_dir):
+    """Generate output with mock MIST-like dependency under `output_dir`."""
+    test_dir = output_dir / "mist_test"
     test_dir.mkdir(parents=True, exist_ok=True)
 
-    # Create a mock MIST-like file for demonstration
-    mock_mist_dir = test_dir / "mock_deps"
-    mock_mist_dir.mkdir(exist_ok=True)
-
-    # Create a simplified mock MIST
-    mock_mist_content = """-- Mock MIST (Mission Scripting Tools)
--- This is a simplified mock for demonstration purposes
--- Real MIST is much more comprehensive
-
-mist = {}
-mist.majorVersion = 4
-mist.minorVersion = 5
-mist.build = 126
-
--- Core MIST tables
-mist.flagFuncs = {}
-mist.mapObjs = {}
-mist.DBs = {}
-mist.dynAdd = {}
-mist.utils = {}
-mist.vec = {}
-mist.goRoute = {}
-mist.ground = {}
-
--- Some basic MIST utilities
-mist.utils.get2DDist = function(point1, point2)
-    local xDiff = point1.x - point2.x
-    local zDiff = point1.z - point2.z
-    return math.sqrt(xDiff * xDiff + zDiff * zDiff)
-end
+    # Copy in the checked-in mock MIST-like library (a simplified stand-in for demonstration)
+    shutil.copytree(PROJECT_ROOT / "tests" / "fixtures" / "mist_mock", test_dir / "mock_deps", dirs_exist_ok=True)
 
-mist.utils.get3DDist = function(point1, point2)
-    local xDiff = point1.x - point2.x
-    local yDiff = (point1.y or 0) - (point2.y or 0)
-    local zDiff = point1.z - point2.z
-    return math.sqrt(xDiff * xDiff + yDiff * yDiff + zDiff * zDiff)
-end
-
-mist.utils.makeVec3 = function(vec2, y)
-    if not vec2.z then
-        return {x = vec2.x, y = y or 0, z = vec2.y}
-    else
-        return {x = vec2.x, y = y or vec2.y or 0, z = vec2.z}
-    end
-end
-
--- Scheduler function
-mist.scheduleFunction = function(fn, vars, time)
-    timer.scheduleFunction(fn, vars, time)
-end
-
--- Message functions
-mist.message = {}
-mist.message.add = function(msgTable)
-    trigger.action.outText(msgTable.text or "", msgTable.displayTime or 10)
-end
-
-env.info("MIST " .. mist.majorVersion .. "." .. mist.minorVersion .. "." .. mist.build .. " loaded")
-
-return mist"""
-
-    (mock_mist_dir / "mist.lua").write_text(mock_mist_content)
-
-    # Create mock license
-    (mock_mist_dir / "LICENSE").write_text("""MIST License
-Free to use for DCS World mission making.
-See https://github.com/mrSkortch/MissionScriptingTools for details.""")
-
-    output_file = OUTPUT_DIR / "example_with_mist_like.lua"
+    output_file = output_dir / "example_with_mist_like.lua"
 
     dependencies = [
         {
@@ -211,9 +170,9 @@ AdvancedMission.init()"""
     )
 
 
-def test_multiple_dependencies():
-    """Generate output with multiple dependencies."""
-    test_dir = OUTPUT_DIR / "multi_dep_test"
+def build_multiple_deps_example(output_dir):
+    """Generate output with multiple dependencies under `output_dir`."""
+    test_dir = output_dir / "multi_dep_test"
     test_dir.mkdir(parents=True, exist_ok=True)
 
     # Create some local test dependencies
@@ -221,7 +180,9 @@ def test_multiple_dependencies():
     deps_dir.mkdir(exist_ok=True)
 
     # First dependency - utilities
-    (deps_dir / "utils.lua").write_text("""-- Utility Library
+    _write_text(
+        deps_dir / "utils.lua",
+        """-- Utility Library
 Utils = {}
 
 function Utils.formatTime(seconds)
@@ -240,13 +201,19 @@ function Utils.randomPoint(center, radius)
     }
 end
 
-return Utils""")
+return Utils""",
+    )
 
-    (deps_dir / "utils_license.txt").write_text("""Public Domain
-No rights reserved.""")
+    _write_text(
+        deps_dir / "utils_license.txt",
+        """Public Domain
+No rights reserved.""",
+    )
 
     # Second dependency - logger
-    (deps_dir / "logger.lua").write_text("""-- Enhanced Logger
+    _write_text(
+        deps_dir / "logger.lua",
+        """-- Enhanced Logger
 Logger = {
     levels = {
         DEBUG = 1,
@@ -269,9 +236,10 @@ function Logger:log(level, message)
     end
 end
 
-return Logger""")
+return Logger""",
+    )
 
-    output_file = OUTPUT_DIR / "example_with_multiple_deps.lua"
+    output_file = output_dir / "example_with_multiple_deps.lua"
 
     dependencies = [
         {
@@ -324,17 +292,57 @@ ComplexMission.run()"""
     )
 
 
+def test_with_test_lib(tmp_path):
+    """Build the test library example in a private directory and check it."""
+    content = build_test_lib_example(tmp_path)
+    assert content is not None, "Test Library Example build failed"
+    # The content checked is the build just made in tmp_path, not the checked-in example
+    assert (tmp_path / "example_with_test_lib.lua").is_file()
+    assert (
+        content.index("-- External Dependency: test-lib")
+        < content.index("TestMission = {")
+        < content.index("function TestMission.start()")
+    )
+
+
+def test_with_mist(tmp_path):
+    """Build the mock MIST example in a private directory and check it."""
+    content = build_mist_example(tmp_path)
+    assert content is not None, "MIST Dependency Example build failed"
+    assert (tmp_path / "example_with_mist_like.lua").is_file()
+    assert (
+        content.index("-- External Dependency: mist")
+        < content.index("AdvancedMission = {")
+        < content.index("function AdvancedMission.init()")
+    )
+
+
+def test_multiple_dependencies(tmp_path):
+    """Build the multiple dependencies example in a private directory and check it."""
+    content = build_multiple_deps_example(tmp_path)
+    assert content is not None, "Multiple Dependencies Example build failed"
+    assert (tmp_path / "example_with_multiple_deps.lua").is_file()
+    assert (
+        content.index("-- External Dependency: utils")
+        < content.index("-- External Dependency: logger")
+        < content.index("ComplexMission = {")
+    )
+
+
 def main():
-    """Run all tests and generate example outputs."""
+    """Regenerate the example outputs in tests/output_examples."""
     print("Generating example outputs with dependencies...")
     OUTPUT_DIR.mkdir(exist_ok=True)
 
     results = []
 
-    # Run tests
-    results.append(("Test Library", test_with_test_lib()))
-    results.append(("Multiple Dependencies", test_multiple_dependencies()))
-    results.append(("MIST Integration", test_with_mist()))
+    # Regenerate the checked-in examples
+    for name, build in (
+        ("Test Library", build_test_lib_example),
+        ("Multiple Dependencies", build_multiple_deps_example),
+        ("MIST Integration", build_mist_example),
+    ):
+        results.append((name, build(OUTPUT_DIR) is not None))
 
     # Summary
     print(f"\n{'=' * 60}")